@@ -0,0 +1,196 @@
+# cli.py
+"""
+Headless bulk analysis: runs the construction or hospital analysis over every PDF/XLSX in a
+directory and writes one consolidated CSV or Parquet file.
+
+    python cli.py orcamentos/ --program construction --output auditoria.csv --workers 4
+
+Files already analysed successfully in an existing output file (same path and content hash) are
+skipped, so the command can be re-run over a growing archive; failed files are tried again.
+"""
+import argparse
+import importlib.util
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import List, Optional, Set, Tuple
+
+import pandas as pd
+
+from modules.common import PDF_MIME_TYPE, XLSX_MIME_TYPE, extract_data_from_file, parse_page_range
+from modules.construction_agents import quoting_analyzis_agents_team
+from modules.document_cache import document_cache_key, get_document_result, hash_upload, store_document_result
+from modules.hospital_agents import hospital_agents_team
+from modules.llm_backend import get_backend
+from modules.price_classifier import ANALYSIS_COLUMNS
+from modules.tabular_extraction import extract_items_from_file
+
+CLI_MAX_WORKERS = int(os.getenv("CLI_MAX_WORKERS", 4))
+CLI_DEFAULT_MODEL = os.getenv("CLI_DEFAULT_MODEL", "gemini-2.0-flash")
+
+PROGRAMS = {
+    "construction": quoting_analyzis_agents_team,
+    "hospital": hospital_agents_team,
+}
+MIME_TYPES = {".pdf": PDF_MIME_TYPE, ".xlsx": XLSX_MIME_TYPE}
+FILE_COLUMNS = ["file", "file_hash", "program", "model", "analysis_date", "elapsed_seconds", "error"]
+
+
+class LocalUpload(io.BufferedReader):
+    """
+    A file on disk with the `type` attribute of a Streamlit upload, so the extraction helpers
+    written for uploads read it unchanged.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(io.FileIO(path, "rb"))
+        self.type = MIME_TYPES[os.path.splitext(path)[1].lower()]
+
+
+def find_documents(directory: str) -> List[str]:
+    """
+    PDF and XLSX files under the directory, recursively, in a stable order.
+    """
+    paths = []
+    for root, _, names in os.walk(directory):
+        paths.extend(os.path.join(root, name) for name in names
+                     if os.path.splitext(name)[1].lower() in MIME_TYPES and not name.startswith("~$"))
+    return sorted(paths)
+
+
+def read_output(path: str) -> pd.DataFrame:
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=FILE_COLUMNS + ANALYSIS_COLUMNS)
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    return pd.read_csv(path)
+
+
+def write_output(df: pd.DataFrame, path: str):
+    """
+    Writes to a temporary file first, so an interrupted run never leaves a truncated output.
+    """
+    temp_path = f"{path}.tmp"
+    try:
+        if path.endswith(".parquet"):
+            df.to_parquet(temp_path, index=False)
+        else:
+            df.to_csv(temp_path, index=False)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def processed_files(output: pd.DataFrame) -> Set[Tuple[str, str]]:
+    """
+    (file, file_hash) pairs analysed without error in a previous run.
+    """
+    done = output[output["error"].isna()]
+    return set(zip(done["file"], done["file_hash"]))
+
+
+def analyze_document(path: str, program: str, model_name: str, analysis_date: str,
+                     page_range: Optional[Tuple[int, int]] = None, max_pages: Optional[int] = None) -> List[dict]:
+    """
+    Runs one document through the program's analysis team, like the Streamlit app does, and
+    returns its output rows (one per material, or one with the error).
+    """
+    started_at = time.perf_counter()
+    file_hash, error, analysis = "", None, []
+    try:
+        with LocalUpload(path) as uploaded_file:
+            file_hash = hash_upload(uploaded_file)
+            document_key = document_cache_key(file_hash, program, model_name, analysis_date, page_range, max_pages)
+            raw_text_content = get_document_result(document_key).get("text")
+            if not raw_text_content:
+                raw_text_content = extract_data_from_file(uploaded_file, page_range, max_pages)
+                store_document_result(document_key, text=raw_text_content)
+            extracted_items = extract_items_from_file(uploaded_file)
+
+        if not raw_text_content:
+            error = "Não foi possível extrair texto do arquivo."
+        else:
+            result = PROGRAMS[program](raw_text_content, analysis_date, model_name, extracted_items, document_key)
+            analysis = json.loads(result["analise_json"])
+    except Exception as e:
+        error = str(e) or type(e).__name__
+
+    file_fields = {
+        "file": path,
+        "file_hash": file_hash,
+        "program": program,
+        "model": model_name,
+        "analysis_date": analysis_date,
+        "elapsed_seconds": round(time.perf_counter() - started_at, 3),
+        "error": error,
+    }
+    return [{**file_fields, **row} for row in analysis] or [file_fields]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Análise de preços em lote de orçamentos PDF/XLSX.")
+    parser.add_argument("directory", help="Diretório com os arquivos .pdf e .xlsx a analisar.")
+    parser.add_argument("--program", choices=sorted(PROGRAMS), default="construction",
+                        help="Programa de análise (padrão: construction).")
+    parser.add_argument("--model", default=CLI_DEFAULT_MODEL, help=f"Modelo Gemini (padrão: {CLI_DEFAULT_MODEL}).")
+    parser.add_argument("--output", default="analise.csv", help="Arquivo de saída .csv ou .parquet.")
+    parser.add_argument("--workers", type=int, default=CLI_MAX_WORKERS,
+                        help=f"Arquivos analisados em paralelo (padrão: {CLI_MAX_WORKERS}).")
+    parser.add_argument("--date", default=datetime.now().strftime("%d/%m/%Y"),
+                        help="Data da análise, dd/mm/aaaa (padrão: hoje).")
+    parser.add_argument("--pages", type=parse_page_range, default=None,
+                        help="Páginas dos PDFs a ler, ex.: 1-20 (padrão: todas).")
+    parser.add_argument("--max-pages", type=int, default=None, help="Máximo de páginas lidas por PDF.")
+    parser.add_argument("--force", action="store_true", help="Analisa novamente arquivos já processados.")
+    args = parser.parse_args(argv)
+
+    # Replayed runs (AGENT_BACKEND=replay) do not call the API.
+    if get_backend().uses_quota and not os.getenv("GOOGLE_API_KEY"):
+        print("A variável de ambiente GOOGLE_API_KEY não está definida.", file=sys.stderr)
+        return 2
+    if not args.output.endswith((".csv", ".parquet")):
+        print(f"Formato de saída não suportado: {args.output} (use .csv ou .parquet).", file=sys.stderr)
+        return 2
+    if args.output.endswith(".parquet") and importlib.util.find_spec("pyarrow") is None:
+        print("A saída .parquet requer o pacote pyarrow (pip install pyarrow).", file=sys.stderr)
+        return 2
+    if not os.path.isdir(args.directory):
+        print(f"Diretório não encontrado: {args.directory}", file=sys.stderr)
+        return 2
+
+    output = read_output(args.output)
+    done = set() if args.force else processed_files(output)
+    pending = []
+    for path in find_documents(args.directory):
+        with LocalUpload(path) as uploaded_file:
+            if (path, hash_upload(uploaded_file)) not in done:
+                pending.append(path)
+    print(f"{len(pending)} arquivo(s) a analisar, {len(done)} já processado(s).")
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        futures = {executor.submit(analyze_document, path, args.program, args.model, args.date,
+                                   args.pages, args.max_pages): path
+                   for path in pending}
+        for future in as_completed(futures):
+            path = futures[future]
+            rows = future.result()
+            failed += rows[0]["error"] is not None
+            # Rows from earlier runs of the same file are replaced, and the output is rewritten after
+            # every file so an interrupted run keeps what was already analysed.
+            output = pd.concat([output[output["file"] != path], pd.DataFrame(rows)], ignore_index=True)
+            write_output(output.reindex(columns=FILE_COLUMNS + ANALYSIS_COLUMNS), args.output)
+            print(f"{path}: {len(rows)} linha(s) em {rows[0]['elapsed_seconds']}s"
+                  + (f" - erro: {rows[0]['error']}" if rows[0]["error"] else ""))
+
+    print(f"Concluído: {len(pending) - failed} arquivo(s) analisado(s), {failed} com erro. Saída em {args.output}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
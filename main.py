@@ -1,16 +1,24 @@
 # main.py
 import os
+import time
 from PIL import Image
 import streamlit as st
 import pandas as pd
 import json
-from modules.common import extract_data_from_file, generate_download_link, json_from_LLM_response
-from modules.construction_agents import quoting_analyzis_agents_team, quoting_material_agents_team
-from modules.hospital_agents import hospital_agents_team
+from modules.common import extract_data_from_file, generate_download_link, parse_page_range
+from modules.document_cache import document_cache_key, get_document_result, hash_upload, store_document_result
+from modules.construction_agents import (material_quoting_job_id, quoting_analyzis_agents_team_stream,
+                                         quoting_batch_row, quoting_material_agents_team, quoting_material_batch_stream)
+from modules.hospital_agents import hospital_agents_team_stream
+from modules.job_queue import JobQueueFullError, job_queue
+from modules.metrics import start_metrics_server
+from modules.pipeline import make_job_id
+from modules.tabular_extraction import extract_items_from_file, read_material_descriptions
 from datetime import datetime
 from authlib.integrations.requests_client import OAuth2Session
 
 st.set_page_config(page_title="Material Price Checker", layout="wide")
+start_metrics_server()
 
 CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
 CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
@@ -20,6 +28,8 @@ AUTHORIZATION_ENDPOINT = "https://accounts.google.com/o/oauth2/v2/auth"
 TOKEN_ENDPOINT = "https://oauth2.googleapis.com/token"
 USERINFO_ENDPOINT = "https://openidconnect.googleapis.com/v1/userinfo"
 
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", 2))
+
 
 def get_authorization_url():
     client = OAuth2Session(CLIENT_ID, CLIENT_SECRET,
@@ -148,127 +158,254 @@ def main():
             hospital_program(selected_model, google_api_key)
 
 
+def page_range_input(key):
+    """
+    Optional PDF page selection such as "1-20". Returns (page range or None, whether it is valid).
+    """
+    text = st.text_input("Páginas do PDF (opcional, ex.: 1-20)", key=key,
+                         help="Deixe em branco para analisar todas as páginas.")
+    try:
+        return parse_page_range(text), True
+    except ValueError:
+        st.error(f"Intervalo de páginas inválido: {text}")
+        return None, False
+
+
+def prepare_analysis(session_key, uploaded_file, program, selected_model, today_date, page_range=None):
+    """
+    Extracts the upload once per file, page selection, model and date and keeps the result in the
+    session, so the reruns that poll the analysis job neither re-read the file nor write to the
+    document store.
+    """
+    upload_id = (getattr(uploaded_file, "file_id", None) or uploaded_file.name, uploaded_file.size,
+                 program, selected_model, today_date, page_range)
+    prepared = st.session_state.get(session_key)
+    if prepared is None or prepared["upload_id"] != upload_id:
+        with st.spinner("Extraindo dados do arquivo..."):
+            document_key = document_cache_key(hash_upload(uploaded_file), program, selected_model, today_date,
+                                              page_range)
+            raw_text_content = get_document_result(document_key).get("text")
+            if not raw_text_content:
+                raw_text_content = extract_data_from_file(uploaded_file, page_range)
+                store_document_result(document_key, text=raw_text_content)
+            extracted_items = extract_items_from_file(uploaded_file)
+        prepared = {
+            "upload_id": upload_id,
+            "document_key": document_key,
+            "text": raw_text_content,
+            "extracted_items": extracted_items,
+            "model_name": selected_model,
+            "date": today_date,
+        }
+        st.session_state[session_key] = prepared
+    return prepared
+
+
+def submit_analysis_job(prepared, team_stream, force=False):
+    """
+    Submits the analysis job of a prepared upload when the queue does not hold it (never submitted,
+    or expired), or when `force` is set and it is not running. A resubmitted job resumes after the
+    stages checkpointed by earlier runs. Returns False when the queue is full.
+    """
+    document_key = prepared["document_key"]
+    job = job_queue.get(document_key)
+    if job is not None and (job.active or not force):
+        return True
+    try:
+        job_queue.submit_stream(document_key, lambda: team_stream(
+            prepared["text"], prepared["date"], prepared["model_name"], prepared["extracted_items"], document_key))
+    except JobQueueFullError as e:
+        st.error(f"⚠️ O servidor está ocupado: {e} Por favor, tente novamente em alguns minutos.")
+        return False
+    return True
+
+
+def render_retry_button(prepared, team_stream, key):
+    """
+    Offers to run a failed analysis job again, resuming after its last completed stage.
+    """
+    job = job_queue.get(prepared["document_key"])
+    if job is not None and job.status == "failed" and st.button("Tentar novamente", key=key):
+        if submit_analysis_job(prepared, team_stream, force=True):
+            st.rerun()
+
+
+def render_analysis_job(job_id):
+    """
+    Renders the partial results of a background analysis job and returns the rows of the
+    final analysis, or None while the job is still running. Re-raises the error of a failed job.
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        st.info("A análise expirou. Por favor, inicie-a novamente.")
+        return []
+
+    if job.active:
+        st.info("⏳ Análise em andamento..." if job.status == "running" else "⏳ Análise na fila...")
+        extraction = [items for stage, items in job.events if stage == "extraction"]
+        price_rows = [row for stage, items in job.events if stage == "prices" for row in items]
+        if extraction:
+            st.write(f"Itens extraídos: **{len(extraction[-1])}**")
+            st.dataframe(pd.DataFrame(extraction[-1]))
+        if price_rows:
+            st.write(f"Preços de mercado encontrados: **{len(price_rows)}**")
+            st.dataframe(pd.DataFrame(price_rows))
+        return None
+
+    if job.error is not None:
+        raise job.error
+    return job.result or []
+
+
+def poll_job(job_id):
+    """
+    Reruns the page after a short pause while the job is still running, so its progress refreshes.
+    """
+    job = job_queue.get(job_id)
+    if job is not None and job.active:
+        time.sleep(JOB_POLL_SECONDS)
+        st.rerun()
+
+
+async def quoting_batch_job_stream(materials, today_date, selected_model, min_links):
+    """
+    Batch quotation as a job stream: ("quoting", [(position, row), ...]) as each material finishes.
+    """
+    async for positions, result, error in quoting_material_batch_stream(
+            materials, today_date, selected_model, min_links=min_links):
+        yield "quoting", [(position, quoting_batch_row(materials[position], result, error)) for position in positions]
+
+
 def construction_program(selected_model, google_api_key):
     st.title("🏗️ Material Price Checker")
 
     today_date = datetime.now().strftime("%d/%m/%Y")
 
     option = st.radio("Selecione uma opção:", options=[
-                      'Cotação de produto', 'Análise de cotação'], horizontal=True)
+                      'Cotação de produto', 'Cotação em lote', 'Análise de cotação'], horizontal=True)
 
     if option == 'Análise de cotação':
         st.write("Envie um arquivo PDF ou XLSX com orçamento de materiais de construção para verificar possíveis preços inconsistentes.")
         uploaded_file = st.file_uploader(
             "Faça upload do arquivo (.xlsx ou .pdf)", type=["xlsx", "pdf"], disabled=not google_api_key, help="O arquivo .pdf deve ser um pdf editável (como PDFs gerados por Word).")
 
-        if st.button(label='Iniciar análise', disabled=uploaded_file is None):
-            with st.spinner("Extraindo dados do arquivo..."):
-                raw_text_content = extract_data_from_file(uploaded_file)
+        page_range, valid_page_range = page_range_input("construction_pages")
 
-            if not raw_text_content:
+        if st.button(label='Iniciar análise', disabled=uploaded_file is None or not valid_page_range):
+            st.session_state["construction_job"] = None
+            prepared = prepare_analysis("construction_analysis", uploaded_file, "construction",
+                                        selected_model, today_date, page_range)
+
+            if not prepared["text"]:
                 st.error(
                     "Não foi possível extrair texto do arquivo. Por favor, verifique o formato ou o conteúdo.")
             else:
                 st.success(
                     "Texto extraído com sucesso. Iniciando análise de preços...")
+                if submit_analysis_job(prepared, quoting_analyzis_agents_team_stream, force=True):
+                    st.session_state["construction_job"] = prepared
 
-                analysis_df = pd.DataFrame()
+        prepared = st.session_state.get("construction_job")
+        # An expired job is resubmitted and resumes from its checkpoints.
+        if prepared and submit_analysis_job(prepared, quoting_analyzis_agents_team_stream):
+            job_id = prepared["document_key"]
+            analysis_df = pd.DataFrame()
+            analysis_data = []
 
-                with st.spinner(f"Analisando materiais e pesquisando preços de mercado com {selected_model}..."):
-                    try:
-                        result = quoting_analyzis_agents_team(
-                            raw_text_content, today_date, selected_model)
-                        json_string_analysis = result.get("analise_json")
+            with st.spinner(f"Analisando materiais e pesquisando preços de mercado com {selected_model}..."):
+                try:
+                    analysis_data = render_analysis_job(job_id)
 
-                        if json_string_analysis:
-                            analysis_data = json_from_LLM_response(
-                                json_string_analysis)
-                            analysis_df = pd.DataFrame(analysis_data)
-                        else:
-                            st.warning(
-                                "O agente não retornou dados de análise no formato esperado.")
+                    if analysis_data:
+                        analysis_df = pd.DataFrame(analysis_data)
+                    elif analysis_data is not None:
+                        st.warning(
+                            "O agente não retornou dados de análise no formato esperado.")
 
-                    except json.JSONDecodeError as e:
-                        st.error(
-                            f"Erro ao decodificar JSON da análise: {e}. Saída bruta: {json_string_analysis[:500]}...")
-                    except RuntimeError as e:
-                        if "503" in str(e):
-                            st.error(
-                                "❌ O modelo está sobrecarregado (503 Service Unavailable). Por favor, tente novamente em alguns minutos.")
-                        else:
-                            st.error(f"⚠️ {str(e)}")
-                    except Exception as e:
+                except json.JSONDecodeError as e:
+                    st.error(
+                        f"Erro ao decodificar JSON da análise: {e}.")
+                except RuntimeError as e:
+                    if "503" in str(e):
                         st.error(
-                            f"Ocorreu um erro inesperado durante a orquestração dos agentes: {e}")
-
-                if not analysis_df.empty:
-                    st.subheader("📊 Resumo da Análise de Preços")
-
-                    status_counts = analysis_df['status'].value_counts()
-                    st.write(
-                        f"Total de materiais analisados: **{len(analysis_df)}**")
-                    for status, count in status_counts.items():
-                        if status == "Within market":
-                            st.success(f"**{status}**: {count} materiais")
-                        elif status == "Pesquisa necessária":
-                            st.info(
-                                f"**{status}**: {count} materiais (preços de mercado não encontrados/definidos)")
-                        else:
-                            st.warning(f"**{status}**: {count} materiais")
-
-                    st.markdown("---")
-
-                    st.subheader("Detalhes da Análise")
-
-                    def color_status(val):
-                        if val == "Above market":
-                            color = '#FF8C00'
-                        elif val == "Below market":
-                            color = '#DC143C'
-                        elif val == "Within market":
-                            color = '#3CB371'
-                        elif val == "Research needed":
-                            color = '#4682B4'
-                        else:
-                            color = ''
-                        return f'background-color: {color}'
-
-                    st.dataframe(analysis_df.style.applymap(
-                        color_status, subset=['status']))
+                            "❌ O modelo está sobrecarregado (503 Service Unavailable). Por favor, tente novamente em alguns minutos.")
+                    else:
+                        st.error(f"⚠️ {str(e)}")
+                except Exception as e:
+                    st.error(
+                        f"Ocorreu um erro inesperado durante a orquestração dos agentes: {e}")
 
-                    st.markdown("---")
+            if not analysis_df.empty:
+                st.subheader("📊 Resumo da Análise de Preços")
+
+                status_counts = analysis_df['status'].value_counts()
+                st.write(
+                    f"Total de materiais analisados: **{len(analysis_df)}**")
+                for status, count in status_counts.items():
+                    if status == "Within market":
+                        st.success(f"**{status}**: {count} materiais")
+                    elif status == "Pesquisa necessária":
+                        st.info(
+                            f"**{status}**: {count} materiais (preços de mercado não encontrados/definidos)")
+                    else:
+                        st.warning(f"**{status}**: {count} materiais")
 
-                    for _, row in analysis_df.iterrows():
-                        links = set(row['lowest_price_links'] or [])
-                        if links:
-                            st.markdown(
-                                f"Menores preços para {row['material']}:")
-                            for link in list(links):
-                                st.info(link)
+                st.markdown("---")
 
-                    flagged_materials_df = analysis_df[
-                        (analysis_df['status'] == "Above market") |
-                        (analysis_df['status'] == "Below market") |
-                        (analysis_df['status'] == "Research needed")
-                    ]
+                st.subheader("Detalhes da Análise")
 
-                    if not flagged_materials_df.empty:
-                        st.warning(
-                            "⚠️ **Materiais com Potenciais Inconsistências ou que Requerem Pesquisa:**")
-                        st.dataframe(flagged_materials_df.style.applymap(
-                            color_status, subset=['status']))
+                def color_status(val):
+                    if val == "Above market":
+                        color = '#FF8C00'
+                    elif val == "Below market":
+                        color = '#DC143C'
+                    elif val == "Within market":
+                        color = '#3CB371'
+                    elif val == "Research needed":
+                        color = '#4682B4'
                     else:
-                        st.success(
-                            "🎉 Nenhum material encontrado com preço fora da faixa ou que precise de pesquisa adicional.")
+                        color = ''
+                    return f'background-color: {color}'
+
+                st.dataframe(analysis_df.style.applymap(
+                    color_status, subset=['status']))
+
+                st.markdown("---")
+
+                for _, row in analysis_df.iterrows():
+                    links = set(row['lowest_price_links'] or [])
+                    if links:
+                        st.markdown(
+                            f"Menores preços para {row['material']}:")
+                        for link in list(links):
+                            st.info(link)
 
-                    st.write("📥 Baixar o resultado da análise:")
-                    link = generate_download_link(
-                        df=analysis_df, fileName="resultado_analise.csv")
-                    st.markdown(link, unsafe_allow_html=True)
+                flagged_materials_df = analysis_df[
+                    (analysis_df['status'] == "Above market") |
+                    (analysis_df['status'] == "Below market") |
+                    (analysis_df['status'] == "Research needed")
+                ]
 
+                if not flagged_materials_df.empty:
+                    st.warning(
+                        "⚠️ **Materiais com Potenciais Inconsistências ou que Requerem Pesquisa:**")
+                    st.dataframe(flagged_materials_df.style.applymap(
+                        color_status, subset=['status']))
                 else:
-                    st.info(
-                        "Nenhum dado de material foi processado para análise. Por favor, verifique a saída dos agentes.")
+                    st.success(
+                        "🎉 Nenhum material encontrado com preço fora da faixa ou que precise de pesquisa adicional.")
+
+                st.write("📥 Baixar o resultado da análise:")
+                link = generate_download_link(
+                    df=analysis_df, fileName="resultado_analise.csv")
+                st.markdown(link, unsafe_allow_html=True)
+
+            elif analysis_data is not None:
+                st.info(
+                    "Nenhum dado de material foi processado para análise. Por favor, verifique a saída dos agentes.")
+
+            render_retry_button(prepared, quoting_analyzis_agents_team_stream, key="construction_retry")
+            poll_job(job_id)
 
     elif option == 'Cotação de produto':
 
@@ -281,7 +418,8 @@ def construction_program(selected_model, google_api_key):
             with st.spinner("Realizando cotação..."):
                 try:
                     result = quoting_material_agents_team(
-                        material_description, today_date, selected_model, min_links=min_links or 2)
+                        material_description, today_date, selected_model, min_links=min_links or 2,
+                        job_id=material_quoting_job_id(material_description, today_date, selected_model, min_links or 2))
                     st.success("Cotação realizada com sucesso!")
                     st.subheader(
                         f'📊 Cotação do material "{material_description}":')
@@ -308,6 +446,60 @@ def construction_program(selected_model, google_api_key):
                     st.error(
                         f"Ocorreu um erro inesperado durante a orquestração dos agentes: {e}")
 
+    elif option == 'Cotação em lote':
+        st.write("Cole a lista de produtos (um por linha) ou envie um arquivo CSV ou XLSX com as descrições.")
+        pasted_materials = st.text_area(label='Produtos para cotação (um por linha)')
+        materials_file = st.file_uploader(
+            "Ou faça upload da lista (.csv ou .xlsx)", type=["csv", "xlsx"], disabled=not google_api_key)
+        min_links = st.number_input(
+            label='Número mínimo de URLs:', min_value=1, max_value=10, step=1, key='batch_min_links')
+
+        materials = [line.strip() for line in pasted_materials.splitlines() if line.strip()]
+        if materials_file is not None:
+            try:
+                materials += read_material_descriptions(materials_file)
+            except Exception as e:
+                st.error(f"Não foi possível ler a lista de produtos: {e}")
+
+        if st.button(label='Cotar lista', disabled=not materials):
+            job_id = make_job_id("quoting_batch", today_date, selected_model, min_links or 2, *materials)
+            try:
+                job_queue.submit_stream(job_id, lambda: quoting_batch_job_stream(
+                    materials, today_date, selected_model, min_links or 2))
+                st.session_state["batch_job"] = (job_id, materials)
+            except JobQueueFullError as e:
+                st.error(f"⚠️ O servidor está ocupado: {e} Por favor, tente novamente em alguns minutos.")
+
+        if st.session_state.get("batch_job"):
+            job_id, batch_materials = st.session_state["batch_job"]
+            job = job_queue.get(job_id)
+            if job is None:
+                st.info("A cotação expirou. Por favor, inicie-a novamente.")
+                return
+
+            rows = dict(row for _, rows in job.events for row in rows)
+            st.progress(len(rows) / len(batch_materials),
+                        text=f"Cotados {len(rows)} de {len(batch_materials)} produtos")
+            if job.error is not None:
+                st.error(
+                    f"Ocorreu um erro inesperado durante a orquestração dos agentes: {job.error}")
+
+            batch_df = pd.DataFrame([rows[position] for position in sorted(rows)])
+            if not batch_df.empty and not job.active:
+                failed = int(batch_df['error'].notna().sum())
+                if failed:
+                    st.warning(f"{failed} produtos não puderam ser cotados.")
+                else:
+                    st.success("Cotação em lote realizada com sucesso!")
+            if not batch_df.empty:
+                st.dataframe(batch_df)
+            if not batch_df.empty and not job.active:
+                link = generate_download_link(
+                    df=batch_df, fileName="cotacao_em_lote.csv")
+                st.markdown(link, unsafe_allow_html=True)
+
+            poll_job(job_id)
+
 
 def hospital_program(selected_model, google_api_key):
     st.title("📦 Hospital Material Checker")
@@ -315,39 +507,43 @@ def hospital_program(selected_model, google_api_key):
 
     uploaded_file = st.file_uploader(
         "Faça upload do arquivo (.xlsx ou .pdf)", type=["xlsx", "pdf"], disabled=not google_api_key)
+    page_range, valid_page_range = page_range_input("hospital_pages")
 
-    if uploaded_file:
-        with st.spinner("Extraindo dados do arquivo..."):
-            raw_text_content = extract_data_from_file(uploaded_file)
+    if uploaded_file and valid_page_range:
+        today_date = datetime.now().strftime("%d/%m/%Y")
+
+        prepared = prepare_analysis("hospital_analysis", uploaded_file, "hospital", selected_model, today_date,
+                                    page_range)
 
-        if not raw_text_content:
+        if not prepared["text"]:
             st.error(
                 "Não foi possível extrair texto do arquivo. Por favor, verifique o formato ou o conteúdo.")
         else:
             st.success(
                 "Texto extraído com sucesso. Iniciando análise de preços...")
 
-            today_date = datetime.now().strftime("%d/%m/%Y")
+            # Polling reruns find the job in the queue and do not submit it again; an expired job is
+            # resubmitted and resumes from its checkpoints.
+            if not submit_analysis_job(prepared, hospital_agents_team_stream):
+                return
+            job_id = prepared["document_key"]
 
             analysis_df = pd.DataFrame()
+            analysis_data = []
 
             with st.spinner(f"Analisando materiais e pesquisando preços de mercado com {selected_model}..."):
                 try:
-                    result = hospital_agents_team(
-                        raw_text_content, today_date, selected_model)
-                    json_string_analysis = result.get("analise_json")
+                    analysis_data = render_analysis_job(job_id)
 
-                    if json_string_analysis:
-                        analysis_data = json_from_LLM_response(
-                            json_string_analysis)
+                    if analysis_data:
                         analysis_df = pd.DataFrame(analysis_data)
-                    else:
+                    elif analysis_data is not None:
                         st.warning(
                             "O agente não retornou dados de análise no formato esperado.")
 
                 except json.JSONDecodeError as e:
                     st.error(
-                        f"Erro ao decodificar JSON da análise: {e}. Saída bruta: {json_string_analysis[:500]}...")
+                        f"Erro ao decodificar JSON da análise: {e}.")
                 except RuntimeError as e:
                     if "503" in str(e):
                         st.error(
@@ -420,10 +616,13 @@ def hospital_program(selected_model, google_api_key):
                 link = generate_download_link(
                     df=analysis_df, fileName="resultado_analise.csv")
                 st.markdown(link, unsafe_allow_html=True)
-            else:
+            elif analysis_data is not None:
                 st.info(
                     "Nenhum dado de material foi processado para análise. Por favor, verifique a saída dos agentes.")
 
+            render_retry_button(prepared, hospital_agents_team_stream, key="hospital_retry")
+            poll_job(job_id)
+
 
 if __name__ == "__main__":
     main()
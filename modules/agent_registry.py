@@ -0,0 +1,123 @@
+# agent_registry.py
+import asyncio
+import os
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+from google.adk.agents import Agent
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+
+# Runners built per agent. The default follows SEARCH_MAX_CONCURRENCY (modules.common), so a full
+# search fan-out never waits for a runner.
+RUNNER_POOL_SIZE = int(os.getenv("AGENT_RUNNER_POOL_SIZE", os.getenv("SEARCH_MAX_CONCURRENCY", 8)))
+
+_agents: Dict[Tuple[str, str], Agent] = {}
+_agent_definitions: Dict[int, Tuple[str, Callable[[str], Agent]]] = {}
+_agents_lock = threading.Lock()
+
+
+def get_agent(key: str, model_name: str, factory: Callable[[str], Agent]) -> Agent:
+    """
+    Returns the agent registered under (key, model_name), building it with
+    `factory(model_name)` the first time it is requested.
+    """
+    with _agents_lock:
+        agent = _agents.get((key, model_name))
+        if agent is None:
+            agent = factory(model_name)
+            _agents[(key, model_name)] = agent
+            _agent_definitions[id(agent)] = (key, factory)
+        return agent
+
+
+def get_agent_for_model(agent: Agent, model_name: str) -> Agent:
+    """
+    Returns the same agent definition bound to another model.
+    """
+    if agent.model == model_name:
+        return agent
+    definition = _agent_definitions.get(id(agent))
+    if definition is None:
+        return agent.model_copy(update={"model": model_name})
+    key, factory = definition
+    return get_agent(key, model_name, factory)
+
+
+class RunnerPool:
+    """
+    Bounded pool of `Runner` objects per agent.
+
+    Each runner owns its own `InMemorySessionService` and is handed out to a
+    single caller at a time. At most `max_size` runners are built per agent;
+    once they are all checked out, further callers wait for one to be returned.
+    """
+
+    def __init__(self, max_size: int = RUNNER_POOL_SIZE):
+        self.max_size = max_size
+        self._pools: Dict[int, Tuple[Agent, List[Runner], List[int]]] = {}
+        self._condition = threading.Condition()
+
+    def _pool_for(self, agent: Agent) -> Tuple[Agent, List[Runner], List[int]]:
+        pool = self._pools.get(id(agent))
+        if pool is None:
+            # The agent is kept in the entry so its id cannot be reused while pooled.
+            pool = (agent, [], [0])
+            self._pools[id(agent)] = pool
+        return pool
+
+    def checkout(self, agent: Agent, timeout: Optional[float] = None) -> Runner:
+        with self._condition:
+            _, idle, created = self._pool_for(agent)
+            while not idle and created[0] >= self.max_size:
+                if not self._condition.wait(timeout):
+                    raise TimeoutError(f"No runner available for agent {agent.name}")
+            if idle:
+                return idle.pop()
+            created[0] += 1
+
+        try:
+            return Runner(agent=agent, app_name=agent.name,
+                          session_service=InMemorySessionService())
+        except Exception:
+            with self._condition:
+                created[0] -= 1
+                self._condition.notify()
+            raise
+
+    def checkin(self, runner: Runner):
+        with self._condition:
+            _, idle, _ = self._pool_for(runner.agent)
+            idle.append(runner)
+            self._condition.notify()
+
+    @contextmanager
+    def runner(self, agent: Agent) -> Iterator[Runner]:
+        runner = self.checkout(agent)
+        try:
+            yield runner
+        finally:
+            self.checkin(runner)
+
+    @asynccontextmanager
+    async def runner_async(self, agent: Agent) -> AsyncIterator[Runner]:
+        try:
+            runner = self.checkout(agent, timeout=0)
+        except TimeoutError:
+            # Wait for a free runner off the event loop.
+            runner = await asyncio.to_thread(self.checkout, agent)
+        try:
+            yield runner
+        finally:
+            self.checkin(runner)
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {
+                f"{agent.name}@{agent.model}": {"created": created[0], "idle": len(idle)}
+                for agent, idle, created in self._pools.values()
+            }
+
+
+runner_pool = RunnerPool()
@@ -0,0 +1,108 @@
+# analysis_team.py
+import json
+import uuid
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional, Tuple
+
+from modules.common import (iter_market_prices_async, json_from_LLM_response, match_rows_by_material,
+                            run_agent_or_fail_async)
+from modules.material_canonicalizer import canonical_material_key
+from modules.pipeline import Pipeline, Stage, StageFunction
+from modules.price_classifier import classify_prices
+
+# agent_function(text_content, current_date, user_id, session_id, model_name) -> (response, error),
+# the signature of the search and analyzer agents of both programs.
+AgentFunction = Callable[[str, str, str, str, str], Awaitable[Tuple[Optional[str], Optional[str]]]]
+
+
+def make_prices_stage(search_market_price_async: AgentFunction) -> StageFunction:
+    async def prices_stage(context: dict, emit) -> list:
+        async def search_batch(batch_json: str, batch_session_id: str):
+            return await search_market_price_async(batch_json, context["date"], context["user_id"],
+                                                   batch_session_id, context["model_name"])
+
+        # Repeated materials are searched and priced once; every document line still gets its own
+        # row, with its own quoted price.
+        lines = context["extraction"]
+        positions_by_key = {}
+        for position, item in enumerate(lines):
+            positions_by_key.setdefault(canonical_material_key(item.get('material')), []).append(position)
+        line_positions = list(positions_by_key.values())
+        items = [lines[positions[0]] for positions in line_positions]
+
+        prices = [None] * len(lines)
+        async for positions, rows in iter_market_prices_async(search_batch, items, context["session_id"],
+                                                              context["model_name"], agent_name="de busca de preços"):
+            line_rows = []
+            for position, row in zip(positions, rows):
+                for line in line_positions[position]:
+                    prices[line] = {**row, "material": lines[line].get('material'),
+                                    "quoted_price": lines[line].get('unit_price')}
+                    line_rows.append(prices[line])
+            emit(line_rows)
+        return prices
+
+    return prices_stage
+
+
+def make_analysis_stage(analyze_material_prices_async: AgentFunction) -> StageFunction:
+    async def analysis_stage(context: dict, emit) -> list:
+        # Rows with a known price range are classified directly; only the rest go to the analyzer agent.
+        analysis, research_positions = classify_prices(context["prices"])
+        if research_positions:
+            research_rows = [analysis[i] for i in research_positions]
+            analise_json_string = await run_agent_or_fail_async(
+                analyze_material_prices_async, json.dumps(research_rows, ensure_ascii=False), context["date"],
+                context["user_id"], context["session_id"], context["model_name"], agent_name="de análise de preços")
+            researched = json_from_LLM_response(analise_json_string)
+            for position, row in zip(research_positions, match_rows_by_material(research_rows, researched)):
+                if row is not None:
+                    analysis[position] = row
+        return analysis
+
+    return analysis_stage
+
+
+def build_analysis_pipeline(extraction_stage: StageFunction, search_market_price_async: AgentFunction,
+                            analyze_material_prices_async: AgentFunction) -> Pipeline:
+    """
+    The document analysis pipeline shared by the programs: extraction, market prices and analysis.
+    Only the extraction stage and the search and analyzer agents differ between programs.
+    """
+    return Pipeline([
+        Stage("extraction", extraction_stage),
+        Stage("prices", make_prices_stage(search_market_price_async), requires=("extraction",)),
+        Stage("analysis", make_analysis_stage(analyze_material_prices_async), requires=("prices",)),
+    ])
+
+
+async def analysis_team_stream(pipeline: Pipeline, materials: str, current_date: str, model_name: str,
+                               extracted_items: Optional[list] = None,
+                               job_id: Optional[str] = None) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Runs the analysis pipeline, yielding (stage, items) as soon as each stage produces results:
+    ("extraction", extracted items), ("prices", market price rows) and ("analysis", analyzed rows).
+    When `extracted_items` is given (e.g. from the tabular XLSX extractor) the LLM extraction stage is skipped.
+    With a `job_id` every finished stage is checkpointed, and running the same job again resumes
+    after the last completed stage (a finished job is served entirely from its checkpoints).
+    """
+    context = {
+        "materials": materials,
+        "date": current_date,
+        "model_name": model_name,
+        "extracted_items": extracted_items,
+        "user_id": f"user-{uuid.uuid4()}",
+        "session_id": f"session-{uuid.uuid4()}",
+    }
+    async for stage, items in pipeline.stream(context, job_id):
+        yield stage, items
+
+
+async def analysis_team_async(pipeline: Pipeline, materials: str, current_date: str, model_name: str,
+                              extracted_items: Optional[list] = None, job_id: Optional[str] = None) -> dict:
+    analysis = []
+    async for stage, items in analysis_team_stream(pipeline, materials, current_date, model_name,
+                                                   extracted_items, job_id):
+        if stage == "analysis":
+            analysis = items
+
+    return {"analise_json": json.dumps(analysis, ensure_ascii=False)}
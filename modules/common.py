@@ -1,50 +1,189 @@
 #common_modules.py
+import asyncio
 import json
 import os
-from typing import Optional, Tuple
+import threading
+import time
+from contextvars import ContextVar
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import AsyncIterator, Awaitable, Callable, Iterable, Iterator, List, Optional, Tuple, TypeVar
 import re
+import shutil
+import tempfile
 import pandas as pd
 import PyPDF2
-from io import BytesIO
+import openpyxl
+from contextlib import asynccontextmanager, contextmanager
 import base64
-import pandas as pd
+import datetime
 
-from google.genai import types
 from google.genai.errors import ServerError
-from google.adk.runners import Runner
-from google.adk.sessions import InMemorySessionService
 from google.adk.agents import Agent
+from modules.agent_registry import get_agent_for_model
+from modules.llm_backend import get_backend
+from modules.material_canonicalizer import canonical_material_key
+from modules.material_index import MaterialIndex, normalize_material_name
+from modules.metrics import agent_metrics
+from modules.price_catalog import get_price_catalog
+from modules.rate_limiter import estimate_tokens, rate_limiter
+from modules.resilience import RetryPolicy, fallback_models, get_circuit_breaker, is_transient_error
+from modules.response_cache import get_response_cache, make_cache_key
 
-os.environ["GOOGLE_API_KEY"] = os.getenv("GOOGLE_API_KEY")
+if os.getenv("GOOGLE_API_KEY"):
+    os.environ["GOOGLE_API_KEY"] = os.getenv("GOOGLE_API_KEY")
 
+T = TypeVar("T")
+
+PAGE_SEPARATOR = "\f"
+CHUNK_MAX_CHARS = int(os.getenv("EXTRACTION_CHUNK_MAX_CHARS", 12000))
+CHUNK_OVERLAP_CHARS = int(os.getenv("EXTRACTION_CHUNK_OVERLAP_CHARS", 800))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", 16))
+PDF_MAX_WORKERS = int(os.getenv("PDF_MAX_WORKERS", os.cpu_count() or 1))
+UPLOAD_COPY_BLOCK_BYTES = 1024 * 1024
+SEARCH_BATCH_SIZE = int(os.getenv("SEARCH_BATCH_SIZE", 5))
+SEARCH_MAX_CONCURRENCY = int(os.getenv("SEARCH_MAX_CONCURRENCY", 8))
+SEARCH_BATCH_RETRIES = int(os.getenv("SEARCH_BATCH_RETRIES", 1))
+
+
+def _agent_model_name(agent: Agent) -> str:
+    return agent.model if isinstance(agent.model, str) else getattr(agent.model, "model", str(agent.model))
 
-def call_agent(agent: Agent, message_text: str, user_id: str, session_id: str) -> Tuple[Optional[str], Optional[str]]:
-    session_service = InMemorySessionService()
-    session = session_service.create_session(
-        app_name=agent.name,
-        user_id=user_id,
-        session_id=session_id
-    )
-    runner = Runner(agent=agent, app_name=agent.name,
-                    session_service=session_service)
-    content = types.Content(role="user", parts=[types.Part(text=message_text)])
 
-    final_response = ""
+def _agent_cache_key(agent: Agent, message_text: str) -> str:
+    instruction = agent.instruction if isinstance(agent.instruction, str) else ""
+    return make_cache_key(agent.name, _agent_model_name(agent), instruction, message_text)
+
+
+# Set while retrying: agent calls skip cached answers, which would repeat the answer being retried.
+_skip_cached_responses: ContextVar[bool] = ContextVar("skip_cached_responses", default=False)
+
+
+@contextmanager
+def fresh_agent_responses():
+    """
+    Agent calls made inside the block go to the model even when a cached answer exists.
+    Their new answers are still cached.
+    """
+    token = _skip_cached_responses.set(True)
     try:
-        for event in runner.run(user_id=user_id, session_id=session_id, new_message=content):
-            if event.is_final_response():
-                for part in event.content.parts:
-                    if part.text is not None:
-                        final_response += part.text + "\n"
-        return final_response.strip(), None
-    
-    except ServerError as e:
-        if "503" in str(e) or "UNAVAILABLE" in str(e):
-            return None, "503: Model overloaded"
-        return None, str(e)
+        yield
+    finally:
+        _skip_cached_responses.reset(token)
+
+
+def _is_json_response(response: str) -> bool:
+    try:
+        json_from_LLM_response(response)
+    except ValueError:
+        return False
+    return True
+
+
+AGENT_MAX_CONCURRENCY = int(os.getenv("AGENT_MAX_CONCURRENCY", 16))
+AGENT_SLOT_POLL_SECONDS = 0.05
+
+# Shared by every event loop of the process (run_sync, job queue workers, CLI workers).
+_agent_slots = threading.BoundedSemaphore(AGENT_MAX_CONCURRENCY)
+
+
+@asynccontextmanager
+async def _agent_slot():
+    """
+    Holds one of the AGENT_MAX_CONCURRENCY process-wide agent call slots. Waiting polls instead of
+    blocking a worker thread, so a cancelled caller never takes a slot it cannot give back.
+    """
+    while not _agent_slots.acquire(blocking=False):
+        await asyncio.sleep(AGENT_SLOT_POLL_SECONDS)
+    try:
+        yield
+    finally:
+        _agent_slots.release()
+
+
+def run_sync(coroutine: Awaitable[T]) -> T:
+    """
+    Runs a coroutine to completion from synchronous code.
+    If the current thread already runs an event loop, the coroutine runs on a helper thread.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
+
+
+async def call_agent_async(agent: Agent, message_text: str, user_id: str, session_id: str,
+                           retry_policy: Optional[RetryPolicy] = None) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Runs the agent on the message through the configured backend (live, record or replay)
+    and returns (response, error).
+
+    Every attempt first takes its share of the process-wide per-model rate limit.
+    Transient errors (503 overload, 429 quota) are retried with exponential backoff and jitter.
+    When a model keeps failing, or its circuit breaker is open, the call falls through to the
+    next model of the fallback chain.
+    Only answers that parse as JSON are cached, so a malformed answer is asked again next time.
+    """
+    retry_policy = retry_policy or RetryPolicy()
+    backend = get_backend()
+    cache = get_response_cache() if backend.uses_response_cache else None
+    instruction = agent.instruction if isinstance(agent.instruction, str) else ""
+    prompt_tokens = estimate_tokens(instruction + message_text)
+    last_error = None
+
+    for model_name in fallback_models(_agent_model_name(agent)):
+        candidate = get_agent_for_model(agent, model_name)
+        cache_key = _agent_cache_key(candidate, message_text)
+        if cache is not None and not _skip_cached_responses.get():
+            cached_response = cache.get(cache_key)
+            if cached_response is not None:
+                agent_metrics.record(agent.name, model_name, "cache_hit", 0.0)
+                return cached_response, None
+
+        breaker = get_circuit_breaker(model_name)
+        for attempt in range(retry_policy.max_attempts):
+            if not breaker.allow():
+                break
+            if backend.uses_quota:
+                await rate_limiter.acquire_async(model_name, prompt_tokens)
+            started_at = time.perf_counter()
+            try:
+                async with _agent_slot():
+                    final_response, usage = await backend.run(candidate, message_text, user_id, session_id)
+            except Exception as e:
+                transient = is_transient_error(e)
+                agent_metrics.record(agent.name, model_name, "transient_error" if transient else "error",
+                                     time.perf_counter() - started_at, prompt_tokens=prompt_tokens)
+                if not transient:
+                    breaker.record_success()
+                    return None, str(e)
+                breaker.record_failure()
+                last_error = e
+                if attempt + 1 < retry_policy.max_attempts:
+                    await asyncio.sleep(retry_policy.delay(attempt))
+                continue
+
+            breaker.record_success()
+            # Token counts fall back to estimates when the event stream carries no usage metadata.
+            agent_metrics.record(agent.name, model_name, "success", time.perf_counter() - started_at,
+                                 prompt_tokens=usage["prompt_tokens"] or prompt_tokens,
+                                 response_tokens=usage["response_tokens"] or estimate_tokens(final_response),
+                                 tool_calls=usage["tool_calls"])
+            if cache is not None and final_response and _is_json_response(final_response):
+                cache.set(cache_key, final_response)
+            return final_response, None
+
+    if last_error is None or isinstance(last_error, ServerError):
+        return None, "503: Model overloaded"
+    return None, str(last_error)
+
+
+def call_agent(agent: Agent, message_text: str, user_id: str, session_id: str) -> Tuple[Optional[str], Optional[str]]:
+    return run_sync(call_agent_async(agent, message_text, user_id, session_id))
 
-    except Exception as e:
-        return None, str(e)
 
 def run_agent_or_fail(agent_func, *args, agent_name: str):
     result, error = agent_func(*args)
@@ -54,6 +193,16 @@ def run_agent_or_fail(agent_func, *args, agent_name: str):
         raise RuntimeError(f"❌ O Agente {agent_name} não retornou nenhum resultado.")
     return result
 
+
+async def run_agent_or_fail_async(agent_func, *args, agent_name: str):
+    result, error = await agent_func(*args)
+    if error:
+        raise RuntimeError(f"❌ O Agente {agent_name} falhou: {error}")
+    if not result:
+        raise RuntimeError(f"❌ O Agente {agent_name} não retornou nenhum resultado.")
+    return result
+
+
 def process_prices(results):
     if not results:
         return {'highest_price': None, 'lowest_price': None}
@@ -66,45 +215,513 @@ def process_prices(results):
         "lowest_price": lowest_price,
     }
 
-def extract_data_from_file(uploaded_file):
+PDF_MIME_TYPE = "application/pdf"
+XLSX_MIME_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def extract_data_from_file(uploaded_file, page_range: Optional[Tuple[int, int]] = None, max_pages: Optional[int] = None):
     """
     Extrai o conteúdo textual de arquivos XLSX ou PDF.
     Retorna o conteúdo como uma string. Se a extração falhar, retorna uma string vazia.
+    Para PDFs, `page_range` (1-based, inclusivo) e `max_pages` limitam as páginas lidas.
     """
-    file_type = uploaded_file.type
-
-    if file_type == "application/pdf":
-        return _extract_text_from_pdf(uploaded_file)
-    elif file_type == "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet":
-        return _extract_text_from_xlsx(uploaded_file)
+    if uploaded_file.type == PDF_MIME_TYPE:
+        separator = PAGE_SEPARATOR
+    elif uploaded_file.type == XLSX_MIME_TYPE:
+        separator = "\n"
     else:
         return ""
 
-
-def _extract_text_from_pdf(pdf_file):
-    text = ""
     try:
-        reader = PyPDF2.PdfReader(BytesIO(pdf_file.read()))
-        for page_num in range(len(reader.pages)):
-            page = reader.pages[page_num]
-            text += page.extract_text() or ""
-        text = " ".join(text.split()).strip()
+        blocks = iter_text_blocks(uploaded_file, page_range, max_pages)
+        return separator.join(block for block in blocks if block).strip()
     except Exception as e:
-        print(f"Erro ao extrair texto do PDF com PyPDF2: {e}")
-        return ""  
-    return text
+        print(f"Erro ao extrair texto do arquivo ({uploaded_file.type}): {e}")
+        return ""
+
+
+def parse_page_range(text: str) -> Optional[Tuple[int, int]]:
+    """
+    Parses a 1-based, inclusive page selection such as "3-10" or "5". Blank means every page.
+    Raises ValueError for anything else.
+    """
+    text = (text or "").strip()
+    if not text:
+        return None
+    first, _, last = text.partition("-")
+    first_page, last_page = int(first), int(last or first)
+    if first_page < 1 or last_page < first_page:
+        raise ValueError(f"Intervalo de páginas inválido: {text}")
+    return first_page, last_page
 
 
-def _extract_text_from_xlsx(xlsx_file):
+def iter_text_blocks(uploaded_file, page_range: Optional[Tuple[int, int]] = None,
+                     max_pages: Optional[int] = None) -> Iterator[str]:
+    """
+    Yields the text of the upload lazily, one PDF page or one spreadsheet row (see iter_xlsx_tsv) at a time.
+
+    The upload is first copied to a temporary file in fixed-size blocks, so neither the raw bytes
+    nor the whole document text need to be held in memory at once. PDF page extraction times go
+    to the pdf_page_extraction_seconds metric.
+    """
+    if uploaded_file.type == PDF_MIME_TYPE:
+        with spooled_upload(uploaded_file, ".pdf") as path:
+            for page in iter_pdf_pages(path, page_range, max_pages):
+                agent_metrics.record_pdf_page(page["seconds"])
+                yield page["text"]
+    elif uploaded_file.type == XLSX_MIME_TYPE:
+        with spooled_upload(uploaded_file, ".xlsx") as path:
+            yield from iter_xlsx_tsv(path)
+
+
+@contextmanager
+def spooled_upload(uploaded_file, suffix: str) -> Iterator[str]:
+    """
+    Copies the upload to a temporary file in UPLOAD_COPY_BLOCK_BYTES blocks and yields its path.
+    """
+    uploaded_file.seek(0)
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as temp_file:
+        shutil.copyfileobj(uploaded_file, temp_file, UPLOAD_COPY_BLOCK_BYTES)
     try:
-        df = pd.read_excel(BytesIO(xlsx_file.read()))
-        text_content = df.to_string(index=False, na_rep="")
-        text_content = " ".join(text_content.split()).strip()
-        return text_content
-    except Exception as e:
-        print(f"Erro ao extrair texto do XLSX com pandas: {e}")
+        yield temp_file.name
+    finally:
+        os.remove(temp_file.name)
+
+
+def iter_xlsx_sheets(path: str) -> Iterator[Tuple[str, Iterator[tuple]]]:
+    """
+    Iterates over the sheets of the workbook as (title, cell values of each row), with openpyxl
+    in read-only mode, which streams rows instead of loading the whole workbook.
+    """
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            yield sheet.title, sheet.iter_rows(values_only=True)
+    finally:
+        workbook.close()
 
+
+def _format_cell(value) -> str:
+    """
+    Compact text for a cell: whole floats lose their ".0", dates their midnight time, and
+    whitespace (tabs and line breaks included) is collapsed so a cell never splits a TSV row.
+    """
+    if value is None:
         return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, datetime.datetime) and value.time() == datetime.time():
+        return value.date().isoformat()
+    return " ".join(str(value).split())
+
+
+def iter_xlsx_tsv(path: str) -> Iterator[str]:
+    """
+    Serializes every sheet of the workbook as tab-separated rows, dropping empty rows and columns.
+
+    Rows keep their column positions so the header still lines up with the values, and each row
+    stays on its own line for chunking. Each sheet is read twice in read-only mode (once to find
+    the used columns, once to write them), so memory stays flat on large workbooks. With more than
+    one sheet, each one starts with a "# Sheet: <name>" line.
+    """
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        several_sheets = len(workbook.worksheets) > 1
+        for sheet in workbook.worksheets:
+            used_columns = set()
+            for row in sheet.iter_rows(values_only=True):
+                used_columns.update(i for i, value in enumerate(row) if _format_cell(value))
+            if not used_columns:
+                continue
+            columns = sorted(used_columns)
+
+            if several_sheets:
+                yield f"# Sheet: {sheet.title}"
+            for row in sheet.iter_rows(values_only=True):
+                cells = [_format_cell(row[i]) if i < len(row) else "" for i in columns]
+                if any(cells):
+                    yield "\t".join(cells).rstrip("\t")
+    finally:
+        workbook.close()
+
+
+_BRL_THOUSANDS_ONLY = re.compile(r"^\d{1,3}(\.\d{3})+$")
+
+
+def parse_brl_amount(value) -> Optional[float]:
+    """
+    Parses a BRL amount such as "R$ 5.120,00", "5.795,00 R$", "45.00" or a numeric cell value.
+    Returns None when the value is not a monetary amount.
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return None if pd.isna(value) else float(value)
+
+    text = str(value).replace("R$", "").replace("\xa0", "").replace(" ", "").strip()
+    if not text or not re.fullmatch(r"-?[\d.,]+", text) or not any(char.isdigit() for char in text):
+        return None
+
+    if "," in text and "." in text:
+        decimal_separator = "," if text.rfind(",") > text.rfind(".") else "."
+    elif "," in text:
+        decimal_separator = ","
+    elif _BRL_THOUSANDS_ONLY.match(text.lstrip("-")):
+        decimal_separator = None
+    else:
+        decimal_separator = "."
+
+    thousands_separator = "." if decimal_separator == "," else ","
+    text = text.replace(thousands_separator, "") if decimal_separator else text.replace(".", "")
+    if decimal_separator == ",":
+        text = text.replace(",", ".")
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+_BRL_PRICE_PATTERN = r"(?:R\$\s*\d{1,3}(?:\.\d{3})*(?:,\d{2})|\d{1,3}(?:\.\d{3})*,\d{2}\s*R\$)"
+_LINE_PREFIX_PATTERN = r"^\s*(?:[-*•]\s*|\d+(?:\.\d+)*\s*[.)\-–]\s*)"
+
+
+def pre_parse_line_items(text_content: str) -> Tuple[pd.DataFrame, str]:
+    """
+    Tags candidate (description, unit price) pairs in bulk.
+
+    Every line carrying exactly one BRL amount ("R$ 5.120,00", "5.795,00 R$") becomes a candidate:
+    the amount is parsed and the rest of the line, without list numbering, bullets and filler
+    punctuation, is the description. Lines without an amount, with several (quantity/unit/total
+    columns) or holding totals are returned untouched as the residue for the LLM to resolve.
+    """
+    lines = pd.Series(text_content.splitlines(), dtype="object")
+    lines = lines[lines.str.strip() != ""]
+    if lines.empty:
+        return pd.DataFrame(columns=["material", "unit_price"]), ""
+
+    prices = lines.str.findall(_BRL_PRICE_PATTERN)
+    single_price = prices.str.len() == 1
+
+    descriptions = (lines[single_price]
+                    .str.replace(_BRL_PRICE_PATTERN, " ", regex=True)
+                    .str.replace(_LINE_PREFIX_PATTERN, "", regex=True)
+                    .str.replace(r"\.{2,}|…", " ", regex=True)
+                    .str.split().str.join(" ")
+                    .str.strip(" .,-–:;|"))
+    candidates = pd.DataFrame({
+        "material": descriptions,
+        "unit_price": prices[single_price].str[0].map(parse_brl_amount),
+    })
+    is_total = candidates["material"].str.lower().str.match(r"^(?:sub-?\s?total|total|valor total)\b")
+    candidates = candidates[(candidates["material"].str.count(r"[A-Za-zÀ-ÿ]") >= 3) & ~is_total]
+
+    residue = lines[~lines.index.isin(candidates.index)]
+    return candidates.reset_index(drop=True), "\n".join(residue)
+
+
+def compact_extraction_input(text_content: str) -> str:
+    """
+    Rewrites document text as the compact candidate list produced by pre_parse_line_items
+    followed by the unresolved residue, to shrink the extraction prompt.
+    """
+    candidates, residue = pre_parse_line_items(text_content)
+    if candidates.empty:
+        return text_content
+
+    candidate_lines = "\n".join(
+        f"{material} | {unit_price:.2f}" for material, unit_price in candidates.itertuples(index=False))
+    return (
+        "Pre-parsed candidate items (material | unit_price), review and include them:\n"
+        f"{candidate_lines}\n\n"
+        f"Remaining document text:\n{residue}"
+    )
+
+
+def _collapse_whitespace(text: str) -> str:
+    """
+    Collapses runs of whitespace inside each line and drops blank lines, keeping line breaks
+    so rows and list items stay separable.
+    """
+    lines = (" ".join(line.split()) for line in text.splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def _extract_pdf_page_batch(pdf_path: str, page_numbers: List[int]) -> List[dict]:
+    reader = PyPDF2.PdfReader(pdf_path)
+    pages = []
+    for page_num in page_numbers:
+        started_at = time.perf_counter()
+        text = _collapse_whitespace(reader.pages[page_num].extract_text() or "")
+        pages.append({"page": page_num + 1, "text": text, "seconds": time.perf_counter() - started_at})
+    return pages
+
+
+_pdf_process_pool: Optional[ProcessPoolExecutor] = None
+_pdf_process_pool_lock = threading.Lock()
+
+
+def _get_pdf_process_pool() -> ProcessPoolExecutor:
+    global _pdf_process_pool
+    with _pdf_process_pool_lock:
+        if _pdf_process_pool is None:
+            _pdf_process_pool = ProcessPoolExecutor(max_workers=PDF_MAX_WORKERS)
+        return _pdf_process_pool
+
+
+def iter_pdf_pages(pdf_path: str, page_range: Optional[Tuple[int, int]] = None,
+                   max_pages: Optional[int] = None) -> Iterator[dict]:
+    """
+    Yields {"page", "text", "seconds"} for each selected PDF page, in page order.
+
+    Documents with at least PDF_PARALLEL_MIN_PAGES pages are split into contiguous page batches
+    extracted in parallel by a process pool (each worker opens the file itself); smaller ones
+    are read in-process.
+    """
+    page_count = len(PyPDF2.PdfReader(pdf_path).pages)
+    first_page, last_page = page_range or (1, page_count)
+    page_numbers = list(range(max(first_page, 1) - 1, min(last_page, page_count)))
+    if max_pages is not None:
+        page_numbers = page_numbers[:max_pages]
+
+    if len(page_numbers) < PDF_PARALLEL_MIN_PAGES or PDF_MAX_WORKERS <= 1:
+        yield from _extract_pdf_page_batch(pdf_path, page_numbers)
+        return
+
+    batch_size = -(-len(page_numbers) // (PDF_MAX_WORKERS * 2))
+    batches = [page_numbers[i:i + batch_size] for i in range(0, len(page_numbers), batch_size)]
+    try:
+        results = _get_pdf_process_pool().map(_extract_pdf_page_batch, [pdf_path] * len(batches), batches)
+        for batch in results:
+            yield from batch
+    except BrokenProcessPool as e:
+        print(f"Pool de processos indisponível, extraindo PDF sequencialmente: {e}")
+        yield from _extract_pdf_page_batch(pdf_path, page_numbers)
+
+
+def iter_text_chunks(blocks: Iterable[str], max_chars: int = CHUNK_MAX_CHARS,
+                     overlap_chars: int = CHUNK_OVERLAP_CHARS) -> Iterator[str]:
+    """
+    Packs text blocks (pages, rows) into chunks of at most `max_chars`, cutting only on line
+    boundaries, and yields each chunk as soon as it is full. Each chunk repeats the last lines of
+    the previous one (up to `overlap_chars`) so items that straddle a boundary are seen whole by
+    at least one chunk.
+    """
+    current, current_size = [], 0
+    for block in blocks:
+        for line in block.splitlines():
+            while len(line) > max_chars:
+                cut = line.rfind(" ", 0, max_chars)
+                cut = cut if cut > 0 else max_chars
+                head, line = line[:cut], line[cut:].lstrip()
+                if current and current_size + len(head) + 1 > max_chars:
+                    yield "\n".join(current)
+                    current, current_size = [], 0
+                current.append(head)
+                current_size += len(head) + 1
+            if not line:
+                continue
+
+            if current and current_size + len(line) + 1 > max_chars:
+                yield "\n".join(current)
+                overlap, overlap_size = [], 0
+                for previous in reversed(current):
+                    if overlap_size + len(previous) + 1 > overlap_chars:
+                        break
+                    overlap.insert(0, previous)
+                    overlap_size += len(previous) + 1
+                current, current_size = overlap, overlap_size
+            current.append(line)
+            current_size += len(line) + 1
+    if current:
+        yield "\n".join(current)
+
+
+def split_text_into_chunks(text_content: str, max_chars: int = CHUNK_MAX_CHARS,
+                           overlap_chars: int = CHUNK_OVERLAP_CHARS) -> List[str]:
+    """
+    Splits document text into overlapping chunks on page or line boundaries (see iter_text_chunks).
+    """
+    if len(text_content) <= max_chars:
+        return [text_content] if text_content else []
+    return list(iter_text_chunks(text_content.split(PAGE_SEPARATOR), max_chars, overlap_chars))
+
+
+def merge_items(existing_items: list, new_items: list):
+    index = MaterialIndex(existing_items)
+    for item in new_items:
+        index.add(item)
+    return index.items
+
+
+def merge_chunk_items(chunk_items: List[list]) -> list:
+    """
+    Merges the items extracted from consecutive chunks into one MaterialIndex, dropping repeated materials.
+
+    Items from the overlap between two chunks may also come back truncated by one side of the
+    boundary; when an item has the same price as an item of the previous chunk and one
+    description contains the other, the longer one is kept.
+    """
+    index = MaterialIndex()
+    previous_chunk = []
+    for items in chunk_items:
+        for item in items:
+            material = normalize_material_name(item.get('material'))
+            duplicate = None
+            for candidate in previous_chunk:
+                candidate_material = normalize_material_name(candidate.get('material'))
+                if (candidate.get('unit_price') == item.get('unit_price')
+                        and (material in candidate_material or candidate_material in material)):
+                    duplicate = candidate
+                    break
+            if duplicate is None:
+                index.add(item)
+            elif len(material) > len(normalize_material_name(duplicate.get('material'))):
+                index.replace(duplicate.get('material'), item)
+        previous_chunk = items
+    return index.items
+
+
+async def extract_in_chunks_async(extract_chunk: Callable[[str, str], Awaitable[Tuple[Optional[str], Optional[str]]]],
+                                  text_content: str, session_id: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Splits the document into overlapping chunks, runs `extract_chunk(chunk, chunk_session_id)`
+    on all of them concurrently and merges the extracted items.
+    Returns (JSON array string, error) like the agent functions.
+    """
+    chunks = split_text_into_chunks(text_content)
+    if len(chunks) <= 1:
+        return await extract_chunk(text_content, session_id)
+
+    results = await asyncio.gather(*(
+        extract_chunk(chunk, f"{session_id}-chunk{index}") for index, chunk in enumerate(chunks)))
+
+    chunk_items = []
+    for index, (result, error) in enumerate(results):
+        if error:
+            return None, f"chunk {index + 1}/{len(chunks)}: {error}"
+        try:
+            chunk_items.append(json_from_LLM_response(result) if result else [])
+        except ValueError as e:
+            return None, f"chunk {index + 1}/{len(chunks)}: {e}"
+
+    return json.dumps(merge_chunk_items(chunk_items), ensure_ascii=False), None
+
+
+def match_rows_by_material(items: list, rows: list) -> list:
+    """
+    Pairs each item sent to an agent with its result row by material name, then by canonical key
+    (see modules.material_canonicalizer). Only when the answer has one row per item are the rows
+    still unmatched (reworded by the model) given, in order, to the items left without a match;
+    otherwise those items get None, so the caller can retry them.
+    """
+    matched = [None] * len(items)
+    used = set()
+    for key_function in (normalize_material_name, canonical_material_key):
+        by_material = MaterialIndex([row for row in rows if id(row) not in used], key_function=key_function)
+        for position, item in enumerate(items):
+            if matched[position] is not None:
+                continue
+            row = by_material.get(item.get('material'))
+            if row is not None and id(row) not in used:
+                matched[position] = row
+                used.add(id(row))
+
+    if len(rows) == len(items):
+        leftovers = iter([row for row in rows if id(row) not in used])
+        matched = [row if row is not None else next(leftovers, None) for row in matched]
+    return matched
+
+
+def _not_found_row(item: dict) -> dict:
+    return {
+        "material": item.get('material'),
+        "quoted_price": item.get('unit_price'),
+        "highest_price": None,
+        "lowest_price": None,
+        "lowest_price_links": None,
+    }
+
+
+async def search_in_batches_async(search_batch: Callable[[str, str], Awaitable[Tuple[Optional[str], Optional[str]]]],
+                                  items: list, session_id: str, agent_name: str,
+                                  batch_size: int = SEARCH_BATCH_SIZE, max_concurrency: int = SEARCH_MAX_CONCURRENCY,
+                                  retries: int = SEARCH_BATCH_RETRIES) -> AsyncIterator[Tuple[int, list]]:
+    """
+    Runs `search_batch(batch_json, batch_session_id)` over batches of `batch_size` items, at most
+    `max_concurrency` at a time, and yields (index of the batch's first item, rows) as each batch finishes.
+
+    A batch that fails, or whose answer leaves items out, is retried on its own (only the missing
+    items, skipping cached answers) up to `retries` times; items still missing get a row with null
+    prices. Rows come back in the order of the batch's items. Raises RuntimeError, like run_agent_or_fail, when a batch gets no
+    answer at all.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    batches = [items[start:start + batch_size] for start in range(0, len(items), batch_size)]
+
+    async def run_batch(batch_index: int, batch: list) -> Tuple[int, list]:
+        rows = [None] * len(batch)
+        error = None
+        async with semaphore:
+            for attempt in range(retries + 1):
+                pending = [i for i, row in enumerate(rows) if row is None]
+                if not pending:
+                    break
+                batch_json = json.dumps([batch[i] for i in pending], ensure_ascii=False)
+                batch_session_id = f"{session_id}-batch{batch_index}-{attempt}"
+                if attempt:
+                    with fresh_agent_responses():
+                        result, error = await search_batch(batch_json, batch_session_id)
+                else:
+                    result, error = await search_batch(batch_json, batch_session_id)
+                if error:
+                    continue
+                try:
+                    found = json_from_LLM_response(result) if result else []
+                except ValueError as e:
+                    error = str(e)
+                    continue
+                if isinstance(found, dict):
+                    found = [found]
+                for i, row in zip(pending, match_rows_by_material([batch[i] for i in pending], found)):
+                    rows[i] = row
+
+        if error and all(row is None for row in rows):
+            raise RuntimeError(f"❌ O Agente {agent_name} falhou: lote {batch_index + 1}/{len(batches)}: {error}")
+        return batch_index * batch_size, [row if row is not None else _not_found_row(item)
+                                          for item, row in zip(batch, rows)]
+
+    tasks = [asyncio.ensure_future(run_batch(index, batch)) for index, batch in enumerate(batches)]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def iter_market_prices_async(search_batch: Callable[[str, str], Awaitable[Tuple[Optional[str], Optional[str]]]],
+                                   items: list, session_id: str, model_name: str,
+                                   agent_name: str) -> AsyncIterator[Tuple[List[int], list]]:
+    """
+    Market price rows for `items`, yielded as (positions in `items`, rows).
+
+    Items with fresh observations in the price catalog are answered from it first; only the rest
+    go to search_in_batches_async, and what the search finds is recorded in the catalog.
+    """
+    catalog = get_price_catalog()
+    catalog_rows = [catalog.lookup_search_row(item) for item in items] if catalog else [None] * len(items)
+    hits = [i for i, row in enumerate(catalog_rows) if row is not None]
+    if hits:
+        yield hits, [catalog_rows[i] for i in hits]
+
+    misses = [i for i, row in enumerate(catalog_rows) if row is None]
+    if not misses:
+        return
+    async for start, rows in search_in_batches_async(search_batch, [items[i] for i in misses], session_id, agent_name):
+        if catalog:
+            catalog.record_search_rows(rows, model_name)
+        yield misses[start:start + len(rows)], rows
+
 
 def generate_download_link(df: pd.DataFrame, fileName: str = "data.csv") -> str:
     """
@@ -125,9 +742,9 @@ def generate_download_link(df: pd.DataFrame, fileName: str = "data.csv") -> str:
 
 def json_from_LLM_response(llm_response: str):
     """
-    Extracts JSON from an LLM response that may be surrounded by markdown syntax.
+    Extracts JSON (object or array) from an LLM response that may be surrounded by markdown syntax.
     """
-    match = re.search(r'```(?:json)?\s*(\{.*?\})\s*```', llm_response, re.DOTALL)
+    match = re.search(r'```(?:json)?\s*([\[{].*?[\]}])\s*```', llm_response, re.DOTALL)
 
     if match:
         json_str = match.group(1)
@@ -1,12 +1,34 @@
 # agents.py
+import asyncio
+import json
+import os
 import uuid
+from typing import AsyncIterator, List, Optional, Tuple
+import pandas as pd
 from google.adk.agents import Agent
 from google.adk.tools import google_search
-from modules.common import call_agent, json_from_LLM_response, process_prices, run_agent_or_fail
-
-
-def extract_data_from_text(text_content: str, user_id: str, session_id: str, model_name: str):
-    extractor = Agent(
+from modules.agent_registry import get_agent
+from modules.analysis_team import analysis_team_async, analysis_team_stream, build_analysis_pipeline
+from modules.material_canonicalizer import canonical_material_key
+from modules.material_index import MaterialIndex, normalize_material_name
+from modules.pipeline import Pipeline, Stage, make_job_id
+from modules.price_catalog import get_price_catalog
+from modules.common import (call_agent_async, compact_extraction_input, extract_in_chunks_async,
+                            json_from_LLM_response, process_prices, run_agent_or_fail_async, run_sync,
+                            split_text_into_chunks)
+from modules.rate_limiter import estimate_tokens
+
+EXTRACTION_MAX_ITERATIONS = int(os.getenv("EXTRACTION_MAX_ITERATIONS", 3))
+# The validation loop stops once a pass changes at most this share of the extracted items.
+EXTRACTION_CONVERGENCE_THRESHOLD = float(os.getenv("EXTRACTION_CONVERGENCE_THRESHOLD", 0.02))
+# Estimated prompt tokens the validation loop may spend per document (0 disables the budget).
+EXTRACTION_TOKEN_BUDGET = int(os.getenv("EXTRACTION_TOKEN_BUDGET", 200000))
+EXCERPT_CONTEXT_LINES = 1
+QUOTING_BATCH_MAX_CONCURRENCY = int(os.getenv("QUOTING_BATCH_MAX_CONCURRENCY", 8))
+
+
+def _build_extract_data_from_text_agent(model_name: str) -> Agent:
+    return Agent(
         name='extractor_agent',
         model=model_name,
         description='Agent specialized in extracting construction materials and their unit prices from various documents.',
@@ -57,14 +79,22 @@ def extract_data_from_text(text_content: str, user_id: str, session_id: str, mod
             Remember: Output STRICTLY a valid JSON array. Do not include any additional commentary or explanations. No text outside JSON brackets.
         """
     )
-    input_text = f"Document text for analysis: {text_content}"
-    output = call_agent(extractor, input_text, user_id, session_id)
+
+
+async def extract_data_from_text_async(text_content: str, user_id: str, session_id: str, model_name: str):
+    extractor = get_agent("construction.extract_data_from_text", model_name, _build_extract_data_from_text_agent)
+    input_text = f"Document text for analysis: {compact_extraction_input(text_content)}"
+    output = await call_agent_async(extractor, input_text, user_id, session_id)
 
     return output
 
 
-def validate_extracted_data(text_content: str, extracted_json: str, user_id: str, session_id: str, model_name: str):
-    validator = Agent(
+def extract_data_from_text(text_content: str, user_id: str, session_id: str, model_name: str):
+    return run_sync(extract_data_from_text_async(text_content, user_id, session_id, model_name))
+
+
+def _build_validate_extracted_data_agent(model_name: str) -> Agent:
+    return Agent(
         name='validate_extraction_agent',
         model=model_name,
         description='Agent that validates if the extracted materials and unit prices are accurate based on the provided text.',
@@ -93,6 +123,10 @@ def validate_extracted_data(text_content: str, extracted_json: str, user_id: str
             VERY IMPORTANT: Return ONLY the JSON object. No explanations, comments, or text outside the JSON.
         """
     )
+
+
+async def validate_extracted_data_async(text_content: str, extracted_json: str, user_id: str, session_id: str, model_name: str):
+    validator = get_agent("construction.validate_extracted_data", model_name, _build_validate_extracted_data_agent)
     input_text = f"""
     Document text content:
     {text_content}
@@ -101,13 +135,17 @@ def validate_extracted_data(text_content: str, extracted_json: str, user_id: str
     {extracted_json}
 
     """
-    output = call_agent(validator, input_text, user_id, session_id)
+    output = await call_agent_async(validator, input_text, user_id, session_id)
 
     return output
 
 
-def find_missing_items(text_content: str, extracted_json: str, user_id: str, session_id: str, model_name: str):
-    finder = Agent(
+def validate_extracted_data(text_content: str, extracted_json: str, user_id: str, session_id: str, model_name: str):
+    return run_sync(validate_extracted_data_async(text_content, extracted_json, user_id, session_id, model_name))
+
+
+def _build_find_missing_items_agent(model_name: str) -> Agent:
+    return Agent(
         name='find_missing_items_agent',
         model=model_name,
         description='Agent that find missing items from the extracted data.',
@@ -130,6 +168,10 @@ def find_missing_items(text_content: str, extracted_json: str, user_id: str, ses
             VERY IMPORTANT: Return ONLY the JSON object. No explanations, comments, or text outside the JSON.
         """
     )
+
+
+async def find_missing_items_async(text_content: str, extracted_json: str, user_id: str, session_id: str, model_name: str):
+    finder = get_agent("construction.find_missing_items", model_name, _build_find_missing_items_agent)
     input_text = f"""
     Document text content:
     {text_content}
@@ -137,13 +179,17 @@ def find_missing_items(text_content: str, extracted_json: str, user_id: str, ses
     \nExtracted JSON:
     {extracted_json}
     """
-    output = call_agent(finder, input_text, user_id, session_id)
+    output = await call_agent_async(finder, input_text, user_id, session_id)
 
     return output
 
 
-def search_market_price(text_content: str, current_date: str, user_id: str, session_id: str, model_name: str):
-    searcher = Agent(
+def find_missing_items(text_content: str, extracted_json: str, user_id: str, session_id: str, model_name: str):
+    return run_sync(find_missing_items_async(text_content, extracted_json, user_id, session_id, model_name))
+
+
+def _build_search_market_price_agent(model_name: str) -> Agent:
+    return Agent(
         name='search_agent',
         model=model_name,
         description='Agent that searches the price range of materials.',
@@ -197,16 +243,21 @@ def search_market_price(text_content: str, current_date: str, user_id: str, sess
             Remember: Output STRICTLY a valid JSON array. Do not include any additional commentary or explanations. No text outside JSON brackets.
         """
     )
+
+
+async def search_market_price_async(text_content: str, current_date: str, user_id: str, session_id: str, model_name: str):
+    searcher = get_agent("construction.search_market_price", model_name, _build_search_market_price_agent)
     input_text = f"Materials to search for market prices: {text_content}\nCurrent date: {current_date}"
-    output = call_agent(searcher, input_text, user_id, session_id)
+    output = await call_agent_async(searcher, input_text, user_id, session_id)
     return output
 
 
-def analyze_material_prices(text_content: str, current_date: str, user_id: str, session_id: str, model_name: str):
-    """
-    Compares extracted prices with market prices and flags inconsistencies.
-    """
-    analyzer = Agent(
+def search_market_price(text_content: str, current_date: str, user_id: str, session_id: str, model_name: str):
+    return run_sync(search_market_price_async(text_content, current_date, user_id, session_id, model_name))
+
+
+def _build_analyze_material_prices_agent(model_name: str) -> Agent:
+    return Agent(
         name='price_analyzer_agent',
         model=model_name,
         description='Agent that analyzes and compares construction material prices.',
@@ -247,50 +298,186 @@ def analyze_material_prices(text_content: str, current_date: str, user_id: str,
             Remember: Output STRICTLY a valid JSON array. Do not include any additional commentary or explanations. No text outside JSON brackets.
         """
     )
+
+
+async def analyze_material_prices_async(text_content: str, current_date: str, user_id: str, session_id: str, model_name: str):
+    """
+    Compares extracted prices with market prices and flags inconsistencies.
+    """
+    analyzer = get_agent("construction.analyze_material_prices", model_name, _build_analyze_material_prices_agent)
     input_text = f"Analyze the following data: {text_content}\nCurrent date: {current_date}"
-    output = call_agent(analyzer, input_text, user_id, session_id)
+    output = await call_agent_async(analyzer, input_text, user_id, session_id)
     return output
 
 
-def robust_extraction_pipeline(text_content: str, user_id: str, session_id: str, model_name: str):
-    MAX_ITERATIONS = 3
-    iterations = 0
+def analyze_material_prices(text_content: str, current_date: str, user_id: str, session_id: str, model_name: str):
+    return run_sync(analyze_material_prices_async(text_content, current_date, user_id, session_id, model_name))
 
-    extraction = extract_data_from_text(
-        text_content, user_id, session_id, model_name)
 
-    while iterations < MAX_ITERATIONS:
-        validation = validate_extracted_data(
-            text_content, extraction, user_id, session_id, model_name)
+def _material_line_hits(folded_lines: List[str], material: str) -> List[int]:
+    """
+    Indexes of the (normalized) lines that mention the material: most of its words appear in the line.
+    """
+    words = [word for word in normalize_material_name(material).split() if len(word) > 2]
+    if not words:
+        return []
+    return [i for i, line in enumerate(folded_lines)
+            if sum(word in line for word in words) >= max(1, 0.6 * len(words))]
 
+
+def _excerpt_for_materials(text_content: str, materials: List[str],
+                           context_lines: int = EXCERPT_CONTEXT_LINES) -> Optional[str]:
+    """
+    Lines of the document that mention the given materials (see _material_line_hits), with
+    `context_lines` around each hit. Returns None when a material cannot be located, so the
+    caller falls back to the full text.
+    """
+    lines = text_content.splitlines()
+    folded_lines = [normalize_material_name(line) for line in lines]
+    selected = set()
+    for material in materials:
+        hits = _material_line_hits(folded_lines, material)
+        if not hits:
+            return None
+        for i in hits:
+            selected.update(range(max(0, i - context_lines), min(len(lines), i + context_lines + 1)))
+
+    excerpt, previous = [], None
+    for i in sorted(selected):
+        if previous is not None and i != previous + 1:
+            excerpt.append("[...]")
+        excerpt.append(lines[i])
+        previous = i
+    return "\n".join(excerpt)
+
+
+async def _validate_in_chunks_async(text_content: str, items: list, user_id: str, session_id: str,
+                                    model_name: str) -> Tuple[dict, int]:
+    """
+    Validates the extraction chunk by chunk (see split_text_into_chunks), all chunks concurrently.
+    Each chunk is checked against the items it mentions; items no chunk mentions go to every chunk.
+    An item counts as hallucinated only when every chunk it was sent to flags it.
+    Returns the merged validation data and the estimated prompt tokens spent.
+    """
+    chunks = split_text_into_chunks(text_content) or [text_content]
+    if len(chunks) == 1:
+        chunk_positions = [list(range(len(items)))]
+    else:
+        chunk_lines = [[normalize_material_name(line) for line in chunk.splitlines()] for chunk in chunks]
+        chunk_positions = [[] for _ in chunks]
+        for position, item in enumerate(items):
+            mentioned_in = [index for index, folded_lines in enumerate(chunk_lines)
+                            if _material_line_hits(folded_lines, item.get('material', ''))]
+            for index in mentioned_in or range(len(chunks)):
+                chunk_positions[index].append(position)
+
+    chunk_jsons = [json.dumps([items[position] for position in positions], ensure_ascii=False)
+                   for positions in chunk_positions]
+    tokens_spent = sum(estimate_tokens(chunk) + estimate_tokens(chunk_json)
+                       for chunk, chunk_json in zip(chunks, chunk_jsons))
+    validations = await asyncio.gather(*(
+        run_agent_or_fail_async(validate_extracted_data_async, chunk, chunk_json, user_id,
+                                f"{session_id}-validation{index}", model_name, agent_name="de validação")
+        for index, (chunk, chunk_json) in enumerate(zip(chunks, chunk_jsons))))
+
+    missing_items = MaterialIndex()
+    sent_count = [0] * len(items)
+    flagged_count = [0] * len(items)
+    for positions, validation in zip(chunk_positions, validations):
         validation_data = json_from_LLM_response(validation)
+        for material in validation_data.get('missing_items', []):
+            missing_items.add({"material": material})
+        flagged = MaterialIndex.from_names(validation_data.get('hallucinated_items', []))
+        for position in positions:
+            sent_count[position] += 1
+            flagged_count[position] += items[position].get('material') in flagged
+
+    hallucinated_items = [item.get('material') for item, sent, flagged in zip(items, sent_count, flagged_count)
+                          if sent and flagged == sent]
+    return {"missing_items": [item["material"] for item in missing_items],
+            "hallucinated_items": hallucinated_items}, tokens_spent
 
-        hallucinated_items = validation_data.get('hallucinated_items', [])
-        missing_items = validation_data.get('missing_items', [])
 
+async def robust_extraction_pipeline_async(text_content: str, user_id: str, session_id: str, model_name: str):
+    """
+    Extracts the items and validates them in passes. The first pass validates the whole extraction
+    against the whole document, chunk by chunk (see _validate_in_chunks_async); later passes only validate the items merged in the previous pass,
+    against the document lines they came from. The loop stops once a pass changes no more than
+    EXTRACTION_CONVERGENCE_THRESHOLD of the items, or when EXTRACTION_TOKEN_BUDGET is spent or
+    EXTRACTION_MAX_ITERATIONS passes have run, keeping the extraction as it is.
+    """
+    async def extract_chunk(chunk: str, chunk_session_id: str):
+        return await extract_data_from_text_async(chunk, user_id, chunk_session_id, model_name)
+
+    extraction_json = await run_agent_or_fail_async(
+        extract_in_chunks_async, extract_chunk, text_content, session_id, agent_name="de extração")
+    # Repeated document lines are all kept; the index is only used to recognize known materials.
+    items = json_from_LLM_response(extraction_json)
+    index = MaterialIndex(items)
+
+    to_validate, validation_text = items, text_content
+    tokens_spent = 0
+    for iteration in range(EXTRACTION_MAX_ITERATIONS):
+        if not to_validate:
+            break
+        if iteration == 0:
+            validation_data, validation_tokens = await _validate_in_chunks_async(
+                text_content, items, user_id, session_id, model_name)
+            tokens_spent += validation_tokens
+        else:
+            validation_json = json.dumps(to_validate, ensure_ascii=False)
+            tokens_spent += estimate_tokens(validation_text) + estimate_tokens(validation_json)
+            validation = await run_agent_or_fail_async(
+                validate_extracted_data_async, validation_text, validation_json,
+                user_id, session_id, model_name, agent_name="de validação")
+            validation_data = json_from_LLM_response(validation)
+
+        hallucinated_items = MaterialIndex.from_names(validation_data.get('hallucinated_items', []))
         if hallucinated_items:
-            extraction = [
-                item for item in extraction if item['material'] not in hallucinated_items]
+            items = [item for item in items if item.get('material') not in hallucinated_items]
+            index = MaterialIndex(items)
+        # Excerpts may mention items extracted earlier; those are not missing.
+        missing_items = [material for material in validation_data.get('missing_items', [])
+                         if material not in index]
 
+        new_items = []
         if missing_items:
-            missing = find_missing_items(
-                text_content, missing_items, user_id, session_id, model_name)
+            missing_text = _excerpt_for_materials(text_content, missing_items) or text_content
+            missing_json = json.dumps(missing_items, ensure_ascii=False)
+            tokens_spent += estimate_tokens(missing_text) + estimate_tokens(missing_json)
+            missing = await run_agent_or_fail_async(
+                find_missing_items_async, missing_text, missing_json,
+                user_id, session_id, model_name, agent_name="de itens faltantes")
+            missing = json_from_LLM_response(missing)
             if missing:
-                extraction = merge_items(extraction, missing)
+                new_items = [item for item in missing if index.add(item)]
+                items.extend(new_items)
 
-        if not hallucinated_items and not missing_items:
+        changed_items = len(hallucinated_items) + len(new_items)
+        if changed_items <= EXTRACTION_CONVERGENCE_THRESHOLD * len(items):
+            break
+        if EXTRACTION_TOKEN_BUDGET and tokens_spent >= EXTRACTION_TOKEN_BUDGET:
+            print(f"Orçamento de tokens da validação esgotado ({tokens_spent} tokens estimados); "
+                  f"mantendo a extração atual.")
             break
 
-        iterations += 1
+        to_validate = new_items
+        validation_text = _excerpt_for_materials(
+            text_content, [item.get('material', '') for item in new_items]) or text_content
     else:
-        raise Exception(
-            "Número máximo de tentativas de extração alcançado. A extração de dados pode estar incompleta.")
+        if to_validate:
+            print(f"Número máximo de passes de validação alcançado ({EXTRACTION_MAX_ITERATIONS}); "
+                  f"mantendo a extração atual, que pode estar incompleta.")
 
-    return extraction
+    return json.dumps(items, ensure_ascii=False), None
 
 
-def material_quoting(material_description: str, current_date: str, user_id: str, session_id: str, model_name: str, min_links: int):
-    searcher = Agent(
+def robust_extraction_pipeline(text_content: str, user_id: str, session_id: str, model_name: str):
+    return run_sync(robust_extraction_pipeline_async(text_content, user_id, session_id, model_name))
+
+
+def _build_material_quoting_agent(model_name: str, min_links: int) -> Agent:
+    return Agent(
         name='quoting_agent',
         model=model_name,
         description='Agent that searches the price range of material.',
@@ -319,13 +506,22 @@ def material_quoting(material_description: str, current_date: str, user_id: str,
             Remember: Output STRICTLY a valid JSON object. Do not include any additional commentary or explanations. No text outside JSON brackets.
         """
     )
+
+
+async def material_quoting_async(material_description: str, current_date: str, user_id: str, session_id: str, model_name: str, min_links: int):
+    searcher = get_agent(f"construction.material_quoting.min_links={min_links}", model_name,
+                         lambda model: _build_material_quoting_agent(model, min_links))
     input_text = f"Material to search for market prices: {material_description}\nCurrent date: {current_date}"
-    output = call_agent(searcher, input_text, user_id, session_id)
+    output = await call_agent_async(searcher, input_text, user_id, session_id)
     return output
 
 
-def material_price_revision(material_quoting: str, current_date: str, user_id: str, session_id: str, model_name: str):
-    searcher = Agent(
+def material_quoting(material_description: str, current_date: str, user_id: str, session_id: str, model_name: str, min_links: int):
+    return run_sync(material_quoting_async(material_description, current_date, user_id, session_id, model_name, min_links))
+
+
+def _build_material_price_revision_agent(model_name: str) -> Agent:
+    return Agent(
         name='quoting_agent',
         model=model_name,
         description='Agent that searches the price range of material.',
@@ -373,34 +569,109 @@ def material_price_revision(material_quoting: str, current_date: str, user_id: s
             Remember: Output STRICTLY a valid JSON object. Do not include any additional commentary or explanations. No text outside JSON brackets.
         """
     )
+
+
+async def material_price_revision_async(material_quoting: str, current_date: str, user_id: str, session_id: str, model_name: str):
+    searcher = get_agent("construction.material_price_revision", model_name, _build_material_price_revision_agent)
     input_text = f"Material to revision: {material_quoting}\nCurrent date: {current_date}"
-    output = call_agent(searcher, input_text, user_id, session_id)
+    output = await call_agent_async(searcher, input_text, user_id, session_id)
     return output
 
 
-def quoting_analyzis_agents_team(materials: str, current_date: str, model_name: str):
-    user_id = f"user-{uuid.uuid4()}"
-    session_id = f"session-{uuid.uuid4()}"
+def material_price_revision(material_quoting: str, current_date: str, user_id: str, session_id: str, model_name: str):
+    return run_sync(material_price_revision_async(material_quoting, current_date, user_id, session_id, model_name))
+
+
+async def _extraction_stage(context: dict, emit) -> list:
+    if context["extracted_items"]:
+        return context["extracted_items"]
+    return json_from_LLM_response(await run_agent_or_fail_async(
+        robust_extraction_pipeline_async, context["materials"], context["user_id"], context["session_id"],
+        context["model_name"], agent_name="de extração"))
+
 
-    extracao = run_agent_or_fail(robust_extraction_pipeline, materials,
-                                 user_id, session_id, model_name, agent_name="de extração")
-    busca = run_agent_or_fail(search_market_price, extracao, current_date,
-                              user_id, session_id, model_name, agent_name="de busca de preços")
-    analise_json_string = run_agent_or_fail(
-        analyze_material_prices, busca, current_date, user_id, session_id, model_name, agent_name="de análise de preços")
+analysis_pipeline = build_analysis_pipeline(_extraction_stage, search_market_price_async,
+                                            analyze_material_prices_async)
 
-    return {"analise_json": analise_json_string}
+
+async def quoting_analyzis_agents_team_stream(materials: str, current_date: str, model_name: str,
+                                              extracted_items: Optional[list] = None, job_id: Optional[str] = None):
+    """
+    Streams the construction analysis (see modules.analysis_team.analysis_team_stream).
+    """
+    async for stage, items in analysis_team_stream(analysis_pipeline, materials, current_date, model_name,
+                                                   extracted_items, job_id):
+        yield stage, items
+
+
+async def quoting_analyzis_agents_team_async(materials: str, current_date: str, model_name: str,
+                                             extracted_items: Optional[list] = None, job_id: Optional[str] = None):
+    return await analysis_team_async(analysis_pipeline, materials, current_date, model_name, extracted_items, job_id)
+
+
+def quoting_analyzis_agents_team(materials: str, current_date: str, model_name: str,
+                                 extracted_items: Optional[list] = None, job_id: Optional[str] = None):
+    return run_sync(quoting_analyzis_agents_team_async(materials, current_date, model_name, extracted_items, job_id))
+
+
+async def _quoting_stage(context: dict, emit) -> str:
+    return await run_agent_or_fail_async(material_quoting_async, context["material"], context["date"],
+                                         context["user_id"], context["session_id"], context["model_name"],
+                                         context["min_links"], agent_name="de cotação")
+
+
+async def _revision_stage(context: dict, emit) -> dict:
+    revision = await run_agent_or_fail_async(material_price_revision_async, context["quoting"], context["date"],
+                                             context["user_id"], context["session_id"], context["model_name"],
+                                             agent_name="de revisão de cotação")
+    return json_from_LLM_response(revision)
 
 
-def quoting_material_agents_team(material: str, current_date: str, model_name: str, min_links: int):
-    user_id = f"user-{uuid.uuid4()}"
-    session_id = f"session-{uuid.uuid4()}"
+material_quoting_pipeline = Pipeline([
+    Stage("quoting", _quoting_stage),
+    Stage("revision", _revision_stage, requires=("quoting",)),
+])
+
+
+def material_quoting_job_id(material: str, current_date: str, model_name: str, min_links: int) -> str:
+    return make_job_id("material_quoting", canonical_material_key(material), current_date, model_name, min_links)
+
+
+async def quoting_material_agents_team_async(material: str, current_date: str, model_name: str, min_links: int,
+                                             job_id: Optional[str] = None):
+    """
+    Quotes one material. When the price catalog holds at least `min_links` fresh observations with
+    links for it, they are reused; otherwise the material is searched and revised, and the revised
+    prices are recorded in the catalog. With a `job_id` (see material_quoting_job_id) a quotation
+    whose revision failed resumes from the checkpointed search.
+    """
+    catalog = get_price_catalog()
+    observations = catalog.lookup(material) if catalog else []
+    # Cheapest observation per link.
+    linked_prices = {}
+    for price, link in observations:
+        if link:
+            linked_prices.setdefault(link, price)
+
+    if len(linked_prices) >= min_links:
+        response = {
+            "material": material,
+            "research_results": [{"price": price, "link": link} for link, price in linked_prices.items()],
+        }
+    else:
+        context = {
+            "material": material,
+            "date": current_date,
+            "model_name": model_name,
+            "min_links": min_links,
+            "user_id": f"user-{uuid.uuid4()}",
+            "session_id": f"session-{uuid.uuid4()}",
+        }
+        response = (await material_quoting_pipeline.run(context, job_id))["revision"]
+        if catalog:
+            catalog.record(material, [(result.get('price'), result.get('link'))
+                                      for result in response['research_results']], model_name)
 
-    quoting = run_agent_or_fail(material_quoting, material, current_date,
-                                user_id, session_id, model_name, min_links, agent_name="de cotação")
-    revision = run_agent_or_fail(material_price_revision, quoting, current_date,
-                                 user_id, session_id, model_name, agent_name="de revisão de cotação")
-    response = json_from_LLM_response(revision)
     prices = process_prices(response['research_results'])
     response['highest_price'] = prices['highest_price']
     response['lowest_price'] = prices['lowest_price']
@@ -408,13 +679,69 @@ def quoting_material_agents_team(material: str, current_date: str, model_name: s
     return response
 
 
-def merge_items(existing_items: list, new_items: list):
-    existing_materials = {item.get['material'].lower().strip()
-                          for item in existing_items}
-    merged = existing_items.copy()
+def quoting_material_agents_team(material: str, current_date: str, model_name: str, min_links: int,
+                                 job_id: Optional[str] = None):
+    return run_sync(quoting_material_agents_team_async(material, current_date, model_name, min_links, job_id))
 
-    for item in new_items:
-        if item['material'].lower().strip() not in existing_materials:
-            merged.append(item)
 
-    return merged
+async def quoting_material_batch_stream(materials: List[str], current_date: str, model_name: str, min_links: int,
+                                        max_concurrency: int = QUOTING_BATCH_MAX_CONCURRENCY
+                                        ) -> AsyncIterator[Tuple[List[int], Optional[dict], Optional[str]]]:
+    """
+    Quotes a list of materials with quoting_material_agents_team_async, at most `max_concurrency`
+    at a time, yielding (positions in `materials`, result, error) as each one finishes.
+    Descriptions with the same canonical key are quoted once; a failed material does not stop the others.
+    """
+    positions_by_key = {}
+    for position, material in enumerate(materials):
+        positions_by_key.setdefault(canonical_material_key(material), []).append(position)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def quote(positions: List[int]):
+        async with semaphore:
+            try:
+                material = materials[positions[0]]
+                result = await quoting_material_agents_team_async(
+                    material, current_date, model_name, min_links,
+                    material_quoting_job_id(material, current_date, model_name, min_links))
+                return positions, result, None
+            except (RuntimeError, ValueError, KeyError, TypeError) as e:
+                return positions, None, str(e)
+
+    tasks = [asyncio.ensure_future(quote(positions)) for positions in positions_by_key.values()]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def quoting_batch_row(material: str, result: Optional[dict], error: Optional[str]) -> dict:
+    """
+    One row of the consolidated batch quotation.
+    """
+    research_results = (result or {}).get('research_results') or []
+    return {
+        "material": material,
+        "lowest_price": (result or {}).get('lowest_price'),
+        "highest_price": (result or {}).get('highest_price'),
+        "prices_found": len(research_results),
+        "links": " ".join(str(item.get('link')) for item in research_results if item.get('link')),
+        "error": error,
+    }
+
+
+async def quoting_material_batch_async(materials: List[str], current_date: str, model_name: str, min_links: int,
+                                       max_concurrency: int = QUOTING_BATCH_MAX_CONCURRENCY) -> pd.DataFrame:
+    rows = [None] * len(materials)
+    async for positions, result, error in quoting_material_batch_stream(
+            materials, current_date, model_name, min_links, max_concurrency):
+        for position in positions:
+            rows[position] = quoting_batch_row(materials[position], result, error)
+    return pd.DataFrame(rows)
+
+
+def quoting_material_batch(materials: List[str], current_date: str, model_name: str, min_links: int,
+                           max_concurrency: int = QUOTING_BATCH_MAX_CONCURRENCY) -> pd.DataFrame:
+    return run_sync(quoting_material_batch_async(materials, current_date, model_name, min_links, max_concurrency))
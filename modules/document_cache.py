@@ -0,0 +1,83 @@
+# document_cache.py
+import hashlib
+import json
+import os
+import threading
+from typing import Optional, Tuple
+
+from modules.response_cache import ResponseCache
+
+DOCUMENT_CACHE_ENABLED = os.getenv("DOCUMENT_CACHE_ENABLED", "1") != "0"
+DOCUMENT_CACHE_PATH = os.getenv("DOCUMENT_CACHE_PATH", os.path.join(".cache", "documents.sqlite3"))
+DOCUMENT_CACHE_TTL_SECONDS = int(os.getenv("DOCUMENT_CACHE_TTL_SECONDS", 24 * 60 * 60))
+DOCUMENT_CACHE_MAX_ENTRIES = int(os.getenv("DOCUMENT_CACHE_MAX_ENTRIES", 500))
+HASH_BLOCK_BYTES = 1024 * 1024
+
+
+def hash_upload(uploaded_file) -> str:
+    """
+    SHA-256 of the uploaded bytes, read in blocks.
+    """
+    digest = hashlib.sha256()
+    uploaded_file.seek(0)
+    for block in iter(lambda: uploaded_file.read(HASH_BLOCK_BYTES), b""):
+        digest.update(block)
+    uploaded_file.seek(0)
+    return digest.hexdigest()
+
+
+def document_cache_key(content_hash: str, program: str, model_name: str, date_bucket: str,
+                       page_range: Optional[Tuple[int, int]] = None, max_pages: Optional[int] = None) -> str:
+    """
+    Key for the results of one document analysed by one program and model within a date bucket
+    (the analysis date), so prices are researched again on a new day. A PDF page selection
+    (see modules.common.extract_data_from_file) is part of the key.
+    """
+    parts = [content_hash, program, model_name, date_bucket]
+    if page_range is not None or max_pages is not None:
+        parts.append(f"pages={page_range}:{max_pages}")
+    raw_key = "\x1f".join(parts)
+    return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+
+
+_document_cache: Optional[ResponseCache] = None
+_document_cache_lock = threading.Lock()
+# Serializes the read-merge-write of store_document_result, so concurrent writers (the Streamlit
+# script and the job checkpointing stages) do not overwrite each other's fields.
+_document_merge_lock = threading.Lock()
+
+
+def get_document_cache() -> Optional[ResponseCache]:
+    global _document_cache
+    if not DOCUMENT_CACHE_ENABLED:
+        return None
+    with _document_cache_lock:
+        if _document_cache is None:
+            _document_cache = ResponseCache(DOCUMENT_CACHE_PATH, DOCUMENT_CACHE_TTL_SECONDS,
+                                            DOCUMENT_CACHE_MAX_ENTRIES, table="documents")
+        return _document_cache
+
+
+def get_document_result(key: Optional[str]) -> dict:
+    """
+    Returns what is stored under the key: for a document, its "text" plus the checkpointed stage
+    outputs of its analysis job ("extraction", "prices", "analysis"; see modules.pipeline).
+    """
+    cache = get_document_cache()
+    if key is None or cache is None:
+        return {}
+    stored = cache.get(key)
+    return json.loads(stored) if stored else {}
+
+
+def store_document_result(key: Optional[str], **fields):
+    """
+    Merges the given fields into what is stored under the key, atomically within the process.
+    """
+    cache = get_document_cache()
+    if key is None or cache is None:
+        return
+    with _document_merge_lock:
+        result = get_document_result(key)
+        result.update(fields)
+        cache.set(key, json.dumps(result, ensure_ascii=False))
@@ -1,11 +1,15 @@
 # agents.py
-import uuid
+from typing import Optional
 from google.adk.agents import Agent
 from google.adk.tools import google_search
-from modules.common import call_agent
+from modules.agent_registry import get_agent
+from modules.analysis_team import analysis_team_async, analysis_team_stream, build_analysis_pipeline
+from modules.common import (call_agent_async, compact_extraction_input, extract_in_chunks_async,
+                            json_from_LLM_response, run_agent_or_fail_async, run_sync)
 
-def extract_data_from_text(text_content: str, current_date: str, user_id: str, session_id: str, model_name: str):
-    extractor = Agent(
+
+def _build_extract_data_from_text_agent(model_name: str) -> Agent:
+    return Agent(
         name='extractor_agent',
         model=model_name,
         description='Agent specialized in extracting hospital materials and their unit prices from various documents.',
@@ -55,12 +59,20 @@ def extract_data_from_text(text_content: str, current_date: str, user_id: str, s
             Remember: Output STRICTLY a valid JSON array. Do not include any additional commentary or explanations. No text outside JSON brackets.
         """
     )
-    input_text = f"Document text for analysis: {text_content}\nCurrent date for context: {current_date}"
-    return call_agent(extractor, input_text, user_id, session_id)
 
 
-def search_market_price(text_content: str, current_date: str, user_id: str, session_id: str, model_name: str):
-    searcher = Agent(
+async def extract_data_from_text_async(text_content: str, current_date: str, user_id: str, session_id: str, model_name: str):
+    extractor = get_agent("hospital.extract_data_from_text", model_name, _build_extract_data_from_text_agent)
+    input_text = f"Document text for analysis: {compact_extraction_input(text_content)}\nCurrent date for context: {current_date}"
+    return await call_agent_async(extractor, input_text, user_id, session_id)
+
+
+def extract_data_from_text(text_content: str, current_date: str, user_id: str, session_id: str, model_name: str):
+    return run_sync(extract_data_from_text_async(text_content, current_date, user_id, session_id, model_name))
+
+
+def _build_search_market_price_agent(model_name: str) -> Agent:
+    return Agent(
         name='search_agent',
         model=model_name,
         description='Agent that searches the price range of materials.',
@@ -114,15 +126,20 @@ def search_market_price(text_content: str, current_date: str, user_id: str, sess
             Remember: Output STRICTLY a valid JSON array. Do not include any additional commentary or explanations. No text outside JSON brackets.
         """
     )
+
+
+async def search_market_price_async(text_content: str, current_date: str, user_id: str, session_id: str, model_name: str):
+    searcher = get_agent("hospital.search_market_price", model_name, _build_search_market_price_agent)
     input_text = f"Materials to search for market prices: {text_content}\nCurrent date: {current_date}"
-    return call_agent(searcher, input_text, user_id, session_id)
+    return await call_agent_async(searcher, input_text, user_id, session_id)
 
 
-def analyze_material_prices(text_content: str, current_date: str, user_id: str, session_id: str, model_name: str):
-    """
-    Compares extracted prices with market prices and flags inconsistencies.
-    """
-    analyzer = Agent(
+def search_market_price(text_content: str, current_date: str, user_id: str, session_id: str, model_name: str):
+    return run_sync(search_market_price_async(text_content, current_date, user_id, session_id, model_name))
+
+
+def _build_analyze_material_prices_agent(model_name: str) -> Agent:
+    return Agent(
         name='price_analyzer_agent',
         model=model_name,
         description='Agent that analyzes and compares hospital material prices.',
@@ -163,16 +180,51 @@ def analyze_material_prices(text_content: str, current_date: str, user_id: str,
             Remember: Output STRICTLY a valid JSON array. Do not include any additional commentary or explanations. No text outside JSON brackets.
         """
     )
+
+
+async def analyze_material_prices_async(text_content: str, current_date: str, user_id: str, session_id: str, model_name: str):
+    """
+    Compares extracted prices with market prices and flags inconsistencies.
+    """
+    analyzer = get_agent("hospital.analyze_material_prices", model_name, _build_analyze_material_prices_agent)
     input_text = f"Analyze the following data: {text_content}\nCurrent date: {current_date}"
-    return call_agent(analyzer, input_text, user_id, session_id)
+    return await call_agent_async(analyzer, input_text, user_id, session_id)
+
+
+def analyze_material_prices(text_content: str, current_date: str, user_id: str, session_id: str, model_name: str):
+    return run_sync(analyze_material_prices_async(text_content, current_date, user_id, session_id, model_name))
+
+
+async def _extraction_stage(context: dict, emit) -> list:
+    if context["extracted_items"]:
+        return context["extracted_items"]
+    async def extract_chunk(chunk: str, chunk_session_id: str):
+        return await extract_data_from_text_async(chunk, context["date"], context["user_id"], chunk_session_id,
+                                                  context["model_name"])
+
+    return json_from_LLM_response(await run_agent_or_fail_async(
+        extract_in_chunks_async, extract_chunk, context["materials"], context["session_id"], agent_name="de extração"))
+
+
+analysis_pipeline = build_analysis_pipeline(_extraction_stage, search_market_price_async,
+                                            analyze_material_prices_async)
+
+
+async def hospital_agents_team_stream(materials: str, today_date: str, model_name: str,
+                                      extracted_items: Optional[list] = None, job_id: Optional[str] = None):
+    """
+    Streams the hospital analysis (see modules.analysis_team.analysis_team_stream).
+    """
+    async for stage, items in analysis_team_stream(analysis_pipeline, materials, today_date, model_name,
+                                                   extracted_items, job_id):
+        yield stage, items
 
 
-def hospital_agents_team(materials: str, today_date: str, model_name: str):
-    user_id = f"user-{uuid.uuid4()}"
-    session_id = f"session-{uuid.uuid4()}"
+async def hospital_agents_team_async(materials: str, today_date: str, model_name: str,
+                                     extracted_items: Optional[list] = None, job_id: Optional[str] = None):
+    return await analysis_team_async(analysis_pipeline, materials, today_date, model_name, extracted_items, job_id)
 
-    extracao = extract_data_from_text(materials, today_date, user_id, session_id, model_name)
-    busca = search_market_price(extracao, today_date, user_id, session_id, model_name)
-    analise_json_string = analyze_material_prices(busca, today_date, user_id, session_id, model_name)
 
-    return {"analise_json": analise_json_string}
\ No newline at end of file
+def hospital_agents_team(materials: str, today_date: str, model_name: str,
+                         extracted_items: Optional[list] = None, job_id: Optional[str] = None):
+    return run_sync(hospital_agents_team_async(materials, today_date, model_name, extracted_items, job_id))
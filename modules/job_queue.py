@@ -0,0 +1,118 @@
+# job_queue.py
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+ANALYSIS_MAX_WORKERS = int(os.getenv("ANALYSIS_MAX_WORKERS", 4))
+# Jobs (queued plus running) accepted at once; further submissions are rejected.
+ANALYSIS_MAX_PENDING = int(os.getenv("ANALYSIS_MAX_PENDING", 32))
+# How long finished jobs are kept for their results to be fetched.
+JOB_RESULT_TTL_SECONDS = int(os.getenv("JOB_RESULT_TTL_SECONDS", 60 * 60))
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class JobQueueFullError(Exception):
+    pass
+
+
+class Job:
+    """
+    State of a background job. `events` collects the (stage, items) pairs streamed by the job so far.
+    """
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.status = QUEUED
+        self.events: List[Tuple[str, Any]] = []
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in (QUEUED, RUNNING)
+
+
+class JobQueue:
+    """
+    Runs pipeline streams on a pool of worker threads, outside the caller's thread (e.g. a Streamlit
+    script run), and keeps their progress and results by job ID for polling.
+    """
+
+    def __init__(self, max_workers: int = ANALYSIS_MAX_WORKERS, max_pending: int = ANALYSIS_MAX_PENDING,
+                 result_ttl_seconds: int = JOB_RESULT_TTL_SECONDS):
+        self.max_pending = max_pending
+        self.result_ttl_seconds = result_ttl_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analysis-job")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit_stream(self, job_id: str, stream_factory: Callable[[], AsyncIterator[Tuple[str, Any]]]) -> str:
+        """
+        Queues `stream_factory()` (an async generator of (stage, items), such as the team streams)
+        under `job_id`. Submitting a job ID that is still queued or running returns it without
+        starting the work again. Raises JobQueueFullError when ANALYSIS_MAX_PENDING jobs are active.
+        """
+        with self._lock:
+            self._prune()
+            job = self._jobs.get(job_id)
+            if job is not None and job.active:
+                return job_id
+            if sum(job.active for job in self._jobs.values()) >= self.max_pending:
+                raise JobQueueFullError(f"{self.max_pending} análises já estão em andamento.")
+            job = Job(job_id)
+            self._jobs[job_id] = job
+        self._executor.submit(self._run, job, stream_factory)
+        return job_id
+
+    def _run(self, job: Job, stream_factory: Callable[[], AsyncIterator[Tuple[str, Any]]]):
+        async def consume():
+            async for stage, items in stream_factory():
+                with self._lock:
+                    job.events.append((stage, items))
+                    job.result = items
+
+        with self._lock:
+            job.status = RUNNING
+            job.started_at = time.time()
+        try:
+            asyncio.run(consume())
+            status, error = DONE, None
+        except Exception as e:
+            status, error = FAILED, e
+        with self._lock:
+            job.status = status
+            job.error = error
+            job.finished_at = time.time()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """
+        Snapshot of the job (its events list is copied), or None for an unknown or expired job ID.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            snapshot = Job(job.job_id)
+            snapshot.__dict__.update(job.__dict__, events=list(job.events))
+            return snapshot
+
+    def _prune(self):
+        expired = time.time() - self.result_ttl_seconds
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if not job.active and job.finished_at < expired]:
+            del self._jobs[job_id]
+
+    def stats(self) -> dict:
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {status: statuses.count(status) for status in (QUEUED, RUNNING, DONE, FAILED)}
+
+
+job_queue = JobQueue()
@@ -0,0 +1,156 @@
+# llm_backend.py
+import asyncio
+import json
+import os
+import time
+from typing import Optional, Tuple
+
+from google.adk.agents import Agent
+from google.genai import types
+
+from modules.agent_registry import runner_pool
+from modules.response_cache import make_cache_key
+
+AGENT_BACKEND = os.getenv("AGENT_BACKEND", "live")
+CASSETTE_DIR = os.getenv("AGENT_CASSETTE_DIR", ".cassettes")
+# Seconds to wait before serving a replayed response, or "recorded" to reuse the recorded latency.
+REPLAY_LATENCY = os.getenv("AGENT_REPLAY_LATENCY", "0")
+
+
+class CassetteNotFoundError(Exception):
+    pass
+
+
+class LiveBackend:
+    """
+    Runs agents against Gemini through pooled ADK runners.
+    """
+    name = "live"
+    # Whether responses go through the response cache, and whether calls count against the API quota.
+    uses_response_cache = True
+    uses_quota = True
+
+    async def run(self, agent: Agent, message_text: str, user_id: str, session_id: str) -> Tuple[str, dict]:
+        """
+        Returns the final text plus its usage
+        (prompt/response tokens reported by the model and number of tool or search calls).
+        """
+        content = types.Content(role="user", parts=[types.Part(text=message_text)])
+        final_response = ""
+        usage = {"prompt_tokens": 0, "response_tokens": 0, "tool_calls": 0}
+        async with runner_pool.runner_async(agent) as runner:
+            runner.session_service.create_session(
+                app_name=runner.app_name,
+                user_id=user_id,
+                session_id=session_id
+            )
+            try:
+                async for event in runner.run_async(user_id=user_id, session_id=session_id, new_message=content):
+                    usage_metadata = getattr(event, "usage_metadata", None)
+                    if usage_metadata is not None:
+                        usage["prompt_tokens"] += usage_metadata.prompt_token_count or 0
+                        usage["response_tokens"] += usage_metadata.candidates_token_count or 0
+                    usage["tool_calls"] += len(event.get_function_calls())
+                    if event.grounding_metadata is not None:
+                        usage["tool_calls"] += len(event.grounding_metadata.web_search_queries or [])
+
+                    if event.is_final_response():
+                        for part in event.content.parts:
+                            if part.text is not None:
+                                final_response += part.text + "\n"
+            finally:
+                runner.session_service.delete_session(
+                    app_name=runner.app_name, user_id=user_id, session_id=session_id)
+        return final_response.strip(), usage
+
+
+def _cassette_path(cassette_dir: str, agent: Agent, message_text: str) -> str:
+    # The model is left out of the key so a response recorded after a model fallback still replays.
+    instruction = agent.instruction if isinstance(agent.instruction, str) else ""
+    key = make_cache_key(agent.name, "", instruction, message_text)
+    return os.path.join(cassette_dir, agent.name, f"{key}.json")
+
+
+class RecordingBackend(LiveBackend):
+    """
+    Runs agents live and saves every request/response pair as a cassette file.
+    """
+    name = "record"
+    # Bypass the cache so every response is actually recorded.
+    uses_response_cache = False
+    uses_quota = True
+
+    def __init__(self, cassette_dir: str = CASSETTE_DIR):
+        self.cassette_dir = cassette_dir
+
+    async def run(self, agent: Agent, message_text: str, user_id: str, session_id: str) -> Tuple[str, dict]:
+        started_at = time.perf_counter()
+        final_response, usage = await super().run(agent, message_text, user_id, session_id)
+
+        path = _cassette_path(self.cassette_dir, agent, message_text)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as cassette:
+            json.dump({
+                "agent": agent.name,
+                "model": agent.model if isinstance(agent.model, str) else str(agent.model),
+                "request": message_text,
+                "response": final_response,
+                "usage": usage,
+                "latency_seconds": time.perf_counter() - started_at,
+                "recorded_at": time.time(),
+            }, cassette, ensure_ascii=False, indent=2)
+        return final_response, usage
+
+
+class ReplayBackend:
+    """
+    Serves recorded cassettes back without touching the network.
+
+    `latency` is either a number of seconds to sleep before each response or
+    "recorded" to reproduce the latency observed while recording.
+    """
+    name = "replay"
+    uses_response_cache = False
+    uses_quota = False
+
+    def __init__(self, cassette_dir: str = CASSETTE_DIR, latency: str = REPLAY_LATENCY):
+        self.cassette_dir = cassette_dir
+        self.latency = latency
+
+    async def run(self, agent: Agent, message_text: str, user_id: str, session_id: str) -> Tuple[str, dict]:
+        path = _cassette_path(self.cassette_dir, agent, message_text)
+        if not os.path.exists(path):
+            raise CassetteNotFoundError(f"No recorded response for agent {agent.name} ({path})")
+        with open(path, encoding="utf-8") as cassette:
+            recording = json.load(cassette)
+
+        delay = recording.get("latency_seconds", 0.0) if self.latency == "recorded" else float(self.latency)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return recording["response"], recording.get("usage", {"prompt_tokens": 0, "response_tokens": 0, "tool_calls": 0})
+
+
+_backends = {
+    "live": LiveBackend,
+    "record": RecordingBackend,
+    "replay": ReplayBackend,
+}
+_backend: Optional[LiveBackend] = None
+
+
+def get_backend():
+    if _backend is None:
+        set_backend(AGENT_BACKEND)
+    return _backend
+
+
+def set_backend(backend):
+    """
+    Selects the backend used by call_agent: "live", "record", "replay" or a backend instance.
+    """
+    global _backend
+    if isinstance(backend, str):
+        if backend not in _backends:
+            raise ValueError(f"Unknown agent backend: {backend}")
+        backend = _backends[backend]()
+    _backend = backend
@@ -0,0 +1,129 @@
+# material_canonicalizer.py
+import json
+import os
+import re
+from typing import Dict, List, Tuple
+
+from modules.material_index import normalize_material_name
+
+# Optional JSON file {"word or phrase": "canonical word", ...} merged over MATERIAL_SYNONYMS.
+MATERIAL_SYNONYMS_PATH = os.getenv("MATERIAL_SYNONYMS_PATH", "")
+
+# Words and phrases (already normalized) mapped to one canonical word; "" drops the word.
+MATERIAL_SYNONYMS: Dict[str, str] = {
+    "electric wire": "fio",
+    "wire": "fio",
+    "cabo": "fio",
+    "cable": "fio",
+    "eletrico": "",
+    "electric": "",
+    "flexivel": "",
+    "flexible": "",
+    "cement": "cimento",
+    "sand": "areia",
+    "brick": "tijolo",
+    "pipe": "tubo",
+    "tube": "tubo",
+    "glove": "luva",
+    "luvas": "luva",
+    "syringe": "seringa",
+    "seringas": "seringa",
+    "agulhas": "agulha",
+    "needle": "agulha",
+    "de": "",
+    "do": "",
+    "da": "",
+    "com": "",
+    "para": "",
+    "of": "",
+    "with": "",
+    "for": "",
+}
+
+# Unit spellings -> (canonical unit, factor to it).
+UNITS: Dict[str, Tuple[str, float]] = {
+    "mm": ("mm", 1), "milimetro": ("mm", 1), "milimetros": ("mm", 1),
+    "cm": ("mm", 10), "centimetro": ("mm", 10), "centimetros": ("mm", 10),
+    "m": ("mm", 1000), "mt": ("mm", 1000), "mts": ("mm", 1000), "metro": ("mm", 1000), "metros": ("mm", 1000),
+    "mm2": ("mm2", 1), "m2": ("m2", 1), "m3": ("m3", 1),
+    "pol": ("pol", 1), "polegada": ("pol", 1), "polegadas": ("pol", 1),
+    "g": ("kg", 0.001), "gr": ("kg", 0.001), "kg": ("kg", 1), "quilo": ("kg", 1), "quilos": ("kg", 1),
+    "ml": ("l", 0.001), "l": ("l", 1), "lt": ("l", 1), "litro": ("l", 1), "litros": ("l", 1),
+    "un": ("un", 1), "und": ("un", 1), "unid": ("un", 1), "unidade": ("un", 1), "unidades": ("un", 1),
+    "w": ("w", 1), "kw": ("w", 1000), "v": ("v", 1), "a": ("a", 1),
+}
+
+# Words after which a measure written in "mm" is a cross-section (wire gauge, e.g. "fio 2,5mm").
+CROSS_SECTION_WORDS = {"fio"}
+
+_MEASURE = re.compile(r"^(\d+(?:\.\d+)?(?:x\d+(?:\.\d+)?)*)([a-z]+)?$")
+
+
+def _load_synonyms() -> Dict[str, str]:
+    synonyms = dict(MATERIAL_SYNONYMS)
+    if MATERIAL_SYNONYMS_PATH:
+        with open(MATERIAL_SYNONYMS_PATH, encoding="utf-8") as synonyms_file:
+            synonyms.update({normalize_material_name(word): canonical
+                             for word, canonical in json.load(synonyms_file).items()})
+    return synonyms
+
+
+_synonyms = _load_synonyms()
+_phrases = sorted((phrase for phrase in _synonyms if " " in phrase), key=len, reverse=True)
+
+
+def _format_number(value: float) -> str:
+    return f"{value:.6f}".rstrip("0").rstrip(".")
+
+
+def parse_measure(token: str) -> Tuple[str, str]:
+    """
+    Splits a normalized token such as "2.5mm2", "100cm" or "14x19x39cm" into (value, canonical unit),
+    converting the value to the unit's base ("100cm" -> ("1000", "mm")). Returns ("", "") when the
+    token is not a measure.
+    """
+    match = _MEASURE.match(token)
+    if not match:
+        return "", ""
+    numbers, unit = match.group(1), match.group(2) or ""
+    if unit and unit not in UNITS:
+        return "", ""
+    canonical_unit, factor = UNITS.get(unit, ("", 1))
+    values = [_format_number(float(number) * factor) for number in numbers.split("x")]
+    return "x".join(values), canonical_unit
+
+
+def canonical_tokens(material) -> List[str]:
+    """
+    Canonical words and measures of a material description: normalized (see
+    normalize_material_name), synonyms applied, filler words dropped and measures converted to
+    base units.
+    """
+    # Inch marks would be dropped with the punctuation.
+    text = str(material or "").replace('"', " pol ")
+    text = f" {normalize_material_name(text)} "
+    for phrase in _phrases:
+        text = text.replace(f" {phrase} ", f" {_synonyms[phrase]} ")
+
+    tokens = []
+    for word in text.split():
+        word = _synonyms.get(word, word)
+        if not word:
+            continue
+        value, unit = parse_measure(word)
+        if value:
+            # Only a measure written in mm is a gauge; "100m" or "10cm" after "fio" stay lengths.
+            if _MEASURE.match(word).group(2) == "mm" and CROSS_SECTION_WORDS.intersection(tokens):
+                unit = "mm2"
+            word = value + unit
+        tokens.append(word)
+    return tokens
+
+
+def canonical_material_key(material) -> str:
+    """
+    Stable key for a material: its canonical tokens, deduplicated and sorted, so word order,
+    spelling of units, accents and synonyms do not change it
+    ("Fio elétrico 2,5mm", "Cabo flexível 2.5 mm²" and "ELECTRIC WIRE 2.5MM" share one key).
+    """
+    return " ".join(sorted(set(canonical_tokens(material))))
@@ -0,0 +1,108 @@
+# material_index.py
+import difflib
+import os
+import re
+import unicodedata
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+# 0 disables fuzzy matching; e.g. 0.92 also treats names at least that similar as the same material.
+MATERIAL_SIMILARITY_THRESHOLD = float(os.getenv("MATERIAL_SIMILARITY_THRESHOLD", 0))
+
+_UNITS = r"mm2|mm|cm2|cm|m2|m3|m|km|kg|g|t|ml|l|und|un|pcs|pc|pol|kw|w|v|a"
+_DECIMAL_COMMA = re.compile(r"(\d),(\d)")
+_SPACED_UNIT = re.compile(rf"(\d)\s+({_UNITS})\b")
+_SPACED_DIMENSION = re.compile(r"(\d)\s*x\s*(\d)")
+_PUNCTUATION = re.compile(r"[^\w.\s/]|(?<!\d)\.|\.(?!\d)")
+
+
+def normalize_material_name(material) -> str:
+    """
+    Key used to compare material names: accents folded, lower case, decimal comma turned into a
+    point, units and dimensions glued to their numbers ("100 mm" -> "100mm", "10 x 20" -> "10x20")
+    and punctuation and spacing collapsed.
+    """
+    text = unicodedata.normalize("NFKD", str(material or "").lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = text.replace("²", "2").replace("³", "3")
+    text = _DECIMAL_COMMA.sub(r"\1.\2", text)
+    text = _PUNCTUATION.sub(" ", text)
+    text = _SPACED_DIMENSION.sub(r"\1x\2", text)
+    text = _SPACED_UNIT.sub(r"\1\2", text)
+    return " ".join(text.split())
+
+
+class MaterialIndex:
+    """
+    Items (dicts with a "material" name) keyed by normalized material name (or by `key_function`,
+    e.g. modules.material_canonicalizer.canonical_material_key), in insertion order.
+
+    Lookups, inserts and membership tests are O(1) by key. With a `similarity_threshold` (0-1),
+    a name with no exact key match also matches the closest stored name at least that similar.
+    """
+
+    def __init__(self, items: Iterable[dict] = (), similarity_threshold: float = MATERIAL_SIMILARITY_THRESHOLD,
+                 key_function: Callable[[str], str] = normalize_material_name):
+        self.similarity_threshold = similarity_threshold
+        self.key_function = key_function
+        self._items: List[dict] = []
+        self._positions: Dict[str, int] = {}
+        for item in items:
+            self.add(item)
+
+    @classmethod
+    def from_names(cls, materials: Iterable[str], **kwargs) -> "MaterialIndex":
+        return cls(({"material": material} for material in materials), **kwargs)
+
+    def _find_key(self, material) -> Optional[str]:
+        key = self.key_function(material)
+        if key in self._positions:
+            return key
+        if self.similarity_threshold and self._positions:
+            close = difflib.get_close_matches(key, self._positions.keys(), n=1, cutoff=self.similarity_threshold)
+            if close:
+                return close[0]
+        return None
+
+    def get(self, material) -> Optional[dict]:
+        key = self._find_key(material)
+        return None if key is None else self._items[self._positions[key]]
+
+    def __contains__(self, material) -> bool:
+        return self._find_key(material) is not None
+
+    def add(self, item: dict) -> bool:
+        """
+        Stores the item unless its material is already indexed. Returns whether it was added.
+        """
+        if self._find_key(item.get("material")) is not None:
+            return False
+        self._positions[self.key_function(item.get("material"))] = len(self._items)
+        self._items.append(item)
+        return True
+
+    def replace(self, material, item: dict) -> bool:
+        """
+        Puts `item` in the place of the stored item matching `material`. Returns False when there is
+        no such item or the new name already belongs to another stored item.
+        """
+        key = self._find_key(material)
+        if key is None:
+            return False
+        new_key = self.key_function(item.get("material"))
+        if new_key != key and new_key in self._positions:
+            return False
+        position = self._positions.pop(key)
+        self._positions[new_key] = position
+        self._items[position] = item
+        return True
+
+    @property
+    def items(self) -> List[dict]:
+        return list(self._items)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self) -> Iterator[dict]:
+        return iter(self._items)
+
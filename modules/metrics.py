@@ -0,0 +1,164 @@
+# metrics.py
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+from modules.rate_limiter import rate_limiter
+
+METRICS_JSONL_PATH = os.getenv("AGENT_METRICS_JSONL_PATH", "")
+METRICS_PORT = int(os.getenv("AGENT_METRICS_PORT", 0))
+LATENCY_BUCKETS_SECONDS = (0.05, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+PDF_PAGE_BUCKETS_SECONDS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+_COUNTERS = {
+    "calls": "Agent calls by outcome.",
+    "prompt_tokens": "Prompt tokens sent to the model.",
+    "response_tokens": "Response tokens produced by the model.",
+    "tool_calls": "Tool and search calls made by the agent.",
+}
+
+# Rate limiter stats by model: (stats key, metric name, type, help text).
+_RATE_LIMITER_METRICS = (
+    ("requests", "rate_limiter_requests_total", "counter", "Requests admitted by the rate limiter."),
+    ("queued_requests", "rate_limiter_queued_requests_total", "counter", "Requests delayed by the rate limiter."),
+    ("total_wait_seconds", "rate_limiter_wait_seconds_total", "counter", "Total time requests waited for quota."),
+    ("max_wait_seconds", "rate_limiter_max_wait_seconds", "gauge", "Longest time a request waited for quota."),
+    ("queue_depth", "rate_limiter_queue_depth", "gauge", "Requests currently waiting for quota."),
+)
+
+
+class AgentMetrics:
+    """
+    In-process counters and latency histograms for agent calls, labelled by agent, model and outcome,
+    plus the histogram of PDF page text extraction times. The Prometheus text also includes the
+    queue depth and wait times of the shared rate limiter, to size the model quotas.
+    """
+
+    def __init__(self, jsonl_path: str = METRICS_JSONL_PATH):
+        self.jsonl_path = jsonl_path
+        self._counters: Dict[str, Dict[Tuple[str, str, str], float]] = {name: {} for name in _COUNTERS}
+        self._latency: Dict[Tuple[str, str, str], list] = {}
+        self._pdf_page_seconds = _new_histogram(PDF_PAGE_BUCKETS_SECONDS)
+        self._lock = threading.Lock()
+
+    def record(self, agent_name: str, model_name: str, outcome: str, latency_seconds: float,
+               prompt_tokens: int = 0, response_tokens: int = 0, tool_calls: int = 0):
+        labels = (agent_name, model_name, outcome)
+        with self._lock:
+            for name, value in (("calls", 1), ("prompt_tokens", prompt_tokens),
+                                ("response_tokens", response_tokens), ("tool_calls", tool_calls)):
+                self._counters[name][labels] = self._counters[name].get(labels, 0) + value
+
+            histogram = self._latency.setdefault(labels, _new_histogram(LATENCY_BUCKETS_SECONDS))
+            _observe(histogram, LATENCY_BUCKETS_SECONDS, latency_seconds)
+
+            if self.jsonl_path:
+                with open(self.jsonl_path, "a", encoding="utf-8") as sink:
+                    sink.write(json.dumps({
+                        "timestamp": time.time(),
+                        "agent": agent_name,
+                        "model": model_name,
+                        "outcome": outcome,
+                        "latency_seconds": round(latency_seconds, 4),
+                        "prompt_tokens": prompt_tokens,
+                        "response_tokens": response_tokens,
+                        "tool_calls": tool_calls,
+                    }) + "\n")
+
+    def record_pdf_page(self, seconds: float):
+        with self._lock:
+            _observe(self._pdf_page_seconds, PDF_PAGE_BUCKETS_SECONDS, seconds)
+
+    def to_prometheus_text(self) -> str:
+        lines = []
+        with self._lock:
+            for name, help_text in _COUNTERS.items():
+                metric = f"agent_{name}_total"
+                lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+                for labels, value in sorted(self._counters[name].items()):
+                    lines.append(f"{metric}{{{_format_labels(labels)}}} {value}")
+
+            metric = "agent_call_latency_seconds"
+            lines += [f"# HELP {metric} Wall time of agent calls.", f"# TYPE {metric} histogram"]
+            for labels, histogram in sorted(self._latency.items()):
+                lines += _histogram_lines(metric, _format_labels(labels), LATENCY_BUCKETS_SECONDS, histogram)
+
+            metric = "pdf_page_extraction_seconds"
+            lines += [f"# HELP {metric} Time to extract the text of one PDF page.", f"# TYPE {metric} histogram"]
+            lines += _histogram_lines(metric, "", PDF_PAGE_BUCKETS_SECONDS, self._pdf_page_seconds)
+
+        limiter_stats = sorted(rate_limiter.stats().items())
+        for key, metric, metric_type, help_text in _RATE_LIMITER_METRICS:
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {metric_type}"]
+            for model_name, stats in limiter_stats:
+                lines.append(f'{metric}{{model="{_escape_label(model_name)}"}} {stats[key]}')
+        return "\n".join(lines) + "\n"
+
+
+def _new_histogram(buckets: Tuple[float, ...]) -> list:
+    # [bucket counts..., sum, count]
+    return [0] * len(buckets) + [0.0, 0]
+
+
+def _observe(histogram: list, buckets: Tuple[float, ...], value: float):
+    for i, bound in enumerate(buckets):
+        if value <= bound:
+            histogram[i] += 1
+    histogram[-2] += value
+    histogram[-1] += 1
+
+
+def _histogram_lines(metric: str, label_text: str, buckets: Tuple[float, ...], histogram: list) -> List[str]:
+    prefix = f"{label_text}," if label_text else ""
+    lines = [f'{metric}_bucket{{{prefix}le="{bound}"}} {count}' for bound, count in zip(buckets, histogram)]
+    lines.append(f'{metric}_bucket{{{prefix}le="+Inf"}} {histogram[-1]}')
+    suffix = f"{{{label_text}}}" if label_text else ""
+    lines.append(f"{metric}_sum{suffix} {histogram[-2]}")
+    lines.append(f"{metric}_count{suffix} {histogram[-1]}")
+    return lines
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def _format_labels(labels: Tuple[str, str, str]) -> str:
+    agent_name, model_name, outcome = (_escape_label(value) for value in labels)
+    return f'agent="{agent_name}",model="{model_name}",outcome="{outcome}"'
+
+
+agent_metrics = AgentMetrics()
+
+_metrics_server: Optional[ThreadingHTTPServer] = None
+_metrics_server_lock = threading.Lock()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = agent_metrics.to_prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int = METRICS_PORT):
+    """
+    Serves the metrics in Prometheus text format on localhost:`port`.
+    Does nothing when no port is configured or the server is already running.
+    """
+    global _metrics_server
+    if not port:
+        return
+    with _metrics_server_lock:
+        if _metrics_server is not None:
+            return
+        _metrics_server = ThreadingHTTPServer(("127.0.0.1", port), _MetricsHandler)
+        threading.Thread(target=_metrics_server.serve_forever, daemon=True).start()
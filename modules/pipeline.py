@@ -0,0 +1,105 @@
+# pipeline.py
+import asyncio
+import hashlib
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Optional, Sequence, Tuple
+
+from modules.document_cache import get_document_result, store_document_result
+
+# run(context, emit) -> output. `context` holds the pipeline inputs plus the output of every finished
+# stage under its name; `emit(items)` streams partial results to the caller while the stage runs.
+StageFunction = Callable[[dict, Callable[[Any], None]], Awaitable[Any]]
+
+
+def make_job_id(*parts) -> str:
+    """
+    Deterministic job ID for a pipeline run, so re-running the same inputs resumes the same job.
+    """
+    raw_key = "\x1f".join(str(part) for part in parts)
+    return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+
+
+class Stage:
+    def __init__(self, name: str, run: StageFunction, requires: Sequence[str] = ()):
+        self.name = name
+        self.run = run
+        self.requires = tuple(requires)
+
+
+class Pipeline:
+    """
+    Stages run in dependency order. With a job ID, the output of every finished stage is
+    checkpointed (see modules.document_cache) as soon as it completes, so a failed or interrupted
+    run of the same job resumes after the last completed stage instead of starting over.
+    """
+
+    def __init__(self, stages: List[Stage]):
+        self.stages = self._ordered(stages)
+
+    @staticmethod
+    def _ordered(stages: List[Stage]) -> List[Stage]:
+        by_name = {stage.name: stage for stage in stages}
+        ordered, visiting, done = [], set(), set()
+
+        def visit(stage: Stage):
+            if stage.name in done:
+                return
+            if stage.name in visiting:
+                raise ValueError(f"Pipeline stages have a dependency cycle at {stage.name}")
+            visiting.add(stage.name)
+            for name in stage.requires:
+                if name not in by_name:
+                    raise ValueError(f"Stage {stage.name} requires unknown stage {name}")
+                visit(by_name[name])
+            visiting.discard(stage.name)
+            done.add(stage.name)
+            ordered.append(stage)
+
+        for stage in stages:
+            visit(stage)
+        return ordered
+
+    async def stream(self, context: dict, job_id: Optional[str] = None,
+                     outputs: Optional[dict] = None) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Runs the pipeline, yielding (stage name, items): the partial results a stage emits while it
+        runs, or its whole output when it emits none or comes from a checkpoint.
+        The output of each stage is also put in `outputs`, when given.
+        """
+        checkpoint = get_document_result(job_id)
+        context = dict(context)
+        outputs = {} if outputs is None else outputs
+        for stage in self.stages:
+            if stage.name in checkpoint:
+                context[stage.name] = outputs[stage.name] = checkpoint[stage.name]
+                yield stage.name, checkpoint[stage.name]
+                continue
+
+            emitted = False
+            partials: asyncio.Queue = asyncio.Queue()
+            task = asyncio.ensure_future(stage.run(context, partials.put_nowait))
+            try:
+                while not task.done() or not partials.empty():
+                    getter = asyncio.ensure_future(partials.get())
+                    await asyncio.wait({task, getter}, return_when=asyncio.FIRST_COMPLETED)
+                    if getter.done():
+                        emitted = True
+                        yield stage.name, getter.result()
+                    else:
+                        getter.cancel()
+                output = task.result()
+            finally:
+                task.cancel()
+
+            context[stage.name] = outputs[stage.name] = output
+            store_document_result(job_id, **{stage.name: output})
+            if not emitted:
+                yield stage.name, output
+
+    async def run(self, context: dict, job_id: Optional[str] = None) -> dict:
+        """
+        Runs the pipeline to the end and returns the output of every stage by name.
+        """
+        outputs = {}
+        async for _ in self.stream(context, job_id, outputs):
+            pass
+        return outputs
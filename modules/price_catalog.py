@@ -0,0 +1,117 @@
+# price_catalog.py
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterable, List, Optional, Tuple
+
+from modules.material_canonicalizer import canonical_material_key
+
+PRICE_CATALOG_ENABLED = os.getenv("PRICE_CATALOG_ENABLED", "1") != "0"
+PRICE_CATALOG_PATH = os.getenv("PRICE_CATALOG_PATH", os.path.join(".cache", "price_catalog.sqlite3"))
+# Observations younger than this answer searches without going to Google Search.
+PRICE_CATALOG_FRESHNESS_DAYS = float(os.getenv("PRICE_CATALOG_FRESHNESS_DAYS", 7))
+MAX_CATALOG_LINKS = 5
+
+
+class PriceCatalog:
+    """
+    Historical price observations (canonical material key, price, source link, observed date, model)
+    stored in SQLite. Observations are only appended; `freshness_seconds` decides which ones are
+    recent enough to be reused.
+    """
+
+    def __init__(self, path: str = PRICE_CATALOG_PATH,
+                 freshness_seconds: float = PRICE_CATALOG_FRESHNESS_DAYS * 24 * 60 * 60):
+        self.path = path
+        self.freshness_seconds = freshness_seconds
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS observations ("
+            "material_key TEXT NOT NULL, material TEXT NOT NULL, price REAL NOT NULL, "
+            "link TEXT, observed_at REAL NOT NULL, model TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS observations_material ON observations (material_key, observed_at)")
+
+    def record(self, material: str, observations: Iterable[Tuple[float, Optional[str]]], model_name: str):
+        """
+        Appends (price, link) observations for the material.
+        """
+        now = time.time()
+        key = canonical_material_key(material)
+        rows = [(key, material, float(price), link, now, model_name)
+                for price, link in observations if isinstance(price, (int, float))]
+        if not key or not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO observations (material_key, material, price, link, observed_at, model) "
+                "VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def lookup(self, material: str) -> List[Tuple[float, Optional[str]]]:
+        """
+        Fresh (price, link) observations for the material, cheapest first.
+        """
+        oldest = time.time() - self.freshness_seconds
+        with self._lock:
+            return self._conn.execute(
+                "SELECT price, link FROM observations WHERE material_key = ? AND observed_at >= ? "
+                "ORDER BY price ASC", (canonical_material_key(material), oldest)).fetchall()
+
+    def record_search_rows(self, rows: Iterable[dict], model_name: str):
+        """
+        Stores the price range of market search rows: the lowest price once per link and the highest price.
+        Rows missing either side of the range are skipped, as the catalog could not tell which side
+        a lone price was and would answer later searches with a point range.
+        """
+        for row in rows:
+            lowest_price, highest_price = row.get('lowest_price'), row.get('highest_price')
+            if not all(isinstance(price, (int, float)) for price in (lowest_price, highest_price)):
+                continue
+            links = (row.get('lowest_price_links') or [None])[:MAX_CATALOG_LINKS]
+            observations = [(lowest_price, link) for link in links]
+            if highest_price != lowest_price:
+                observations.append((highest_price, None))
+            self.record(row.get('material'), observations, model_name)
+
+    def lookup_search_row(self, item: dict) -> Optional[dict]:
+        """
+        A market search row for the extracted item built from fresh observations, or None.
+        """
+        observations = self.lookup(item.get('material'))
+        if not observations:
+            return None
+        lowest_price = observations[0][0]
+        return {
+            "material": item.get('material'),
+            "quoted_price": item.get('unit_price'),
+            "highest_price": observations[-1][0],
+            "lowest_price": lowest_price,
+            "lowest_price_links": list(dict.fromkeys(
+                link for price, link in observations if link and price == lowest_price))[:MAX_CATALOG_LINKS],
+        }
+
+
+_price_catalog: Optional[PriceCatalog] = None
+_price_catalog_lock = threading.Lock()
+
+
+def get_price_catalog() -> Optional[PriceCatalog]:
+    """
+    Returns the process-wide price catalog, or None when it is disabled.
+    """
+    global _price_catalog
+    if not PRICE_CATALOG_ENABLED:
+        return None
+    with _price_catalog_lock:
+        if _price_catalog is None:
+            _price_catalog = PriceCatalog()
+        return _price_catalog
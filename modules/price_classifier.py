@@ -0,0 +1,48 @@
+# price_classifier.py
+import os
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+# How far (as a fraction of the range bound) a quote may exceed the highest price or fall short of
+# the lowest price and still count as within market.
+PRICE_TOLERANCE_ABOVE = float(os.getenv("PRICE_TOLERANCE_ABOVE", 0.10))
+PRICE_TOLERANCE_BELOW = float(os.getenv("PRICE_TOLERANCE_BELOW", 0.10))
+
+ANALYSIS_COLUMNS = ["material", "quoted_price", "highest_price", "lowest_price",
+                    "percentage_variation", "status", "lowest_price_links"]
+
+
+def classify_prices(price_rows: list, tolerance_above: float = PRICE_TOLERANCE_ABOVE,
+                    tolerance_below: float = PRICE_TOLERANCE_BELOW) -> Tuple[list, List[int]]:
+    """
+    Computes percentage_variation and status for all market price rows at once.
+
+    The variation is taken against the middle of the [lowest_price, highest_price] range. A quote
+    above highest_price * (1 + tolerance_above) is "Above market", below
+    lowest_price * (1 - tolerance_below) is "Below market", anything else with a known range is
+    "Within market". Rows without a range, or without a quoted price (missing, non-numeric or 0,
+    which the extractors use for "price not found"), get "Research needed"; their positions are
+    returned as well, so only those go to the analyzer agent.
+    """
+    if not price_rows:
+        return [], []
+    rows = pd.DataFrame(price_rows).reindex(columns=ANALYSIS_COLUMNS)
+    quoted = pd.to_numeric(rows["quoted_price"], errors="coerce")
+    lowest = pd.to_numeric(rows["lowest_price"], errors="coerce")
+    highest = pd.to_numeric(rows["highest_price"], errors="coerce")
+
+    has_quote = quoted > 0
+    research_needed = ~(lowest.notna() & highest.notna() & has_quote)
+    average = (lowest + highest) / 2
+    rows["percentage_variation"] = ((quoted - average) / average * 100).where((average > 0) & has_quote).round(2)
+    rows["status"] = np.select(
+        [research_needed,
+         quoted > highest * (1 + tolerance_above),
+         quoted < lowest * (1 - tolerance_below)],
+        ["Research needed", "Above market", "Below market"],
+        default="Within market")
+
+    analysis = rows.astype(object).where(rows.notna(), None).to_dict(orient="records")
+    return analysis, np.flatnonzero(research_needed.to_numpy()).tolist()
@@ -0,0 +1,125 @@
+# rate_limiter.py
+import asyncio
+import os
+import threading
+import time
+from typing import Dict, Tuple
+
+RATE_LIMIT_RPM = float(os.getenv("GEMINI_RATE_LIMIT_RPM", 60))
+RATE_LIMIT_TPM = float(os.getenv("GEMINI_RATE_LIMIT_TPM", 1_000_000))
+# Per-model overrides, e.g. "gemini-1.5-pro=2:32000,gemini-2.0-flash=15:1000000" (rpm:tpm).
+RATE_LIMITS_BY_MODEL = os.getenv("GEMINI_RATE_LIMITS", "")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token estimate (~4 characters per token), good enough for quota accounting.
+    """
+    return len(text) // 4 + 1
+
+
+def _parse_model_limits(spec: str) -> Dict[str, Tuple[float, float]]:
+    limits = {}
+    for entry in spec.split(","):
+        if "=" not in entry:
+            continue
+        model_name, values = entry.split("=", 1)
+        rpm, _, tpm = values.partition(":")
+        limits[model_name.strip()] = (float(rpm), float(tpm or RATE_LIMIT_TPM))
+    return limits
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `capacity` tokens per minute.
+
+    `reserve` always takes the tokens, possibly driving the balance negative, and
+    returns how long the caller must wait for the balance to be paid back. This
+    keeps callers in arrival order without holding a lock while they wait.
+    """
+
+    def __init__(self, capacity_per_minute: float):
+        self.capacity = capacity_per_minute
+        self.refill_rate = capacity_per_minute / 60.0
+        self.tokens = capacity_per_minute
+        self.updated_at = time.monotonic()
+
+    def reserve(self, amount: float) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_rate)
+        self.updated_at = now
+        self.tokens -= min(amount, self.capacity)
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.refill_rate
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute limits per model, shared by the whole process.
+    Callers over the limit are delayed rather than rejected.
+    """
+
+    def __init__(self, rpm: float = RATE_LIMIT_RPM, tpm: float = RATE_LIMIT_TPM,
+                 limits_by_model: Dict[str, Tuple[float, float]] = None):
+        self.default_limits = (rpm, tpm)
+        self.limits_by_model = limits_by_model or {}
+        self._buckets: Dict[str, Tuple[TokenBucket, TokenBucket]] = {}
+        self._stats: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def _model_stats(self, model_name: str) -> dict:
+        return self._stats.setdefault(model_name, {
+            "requests": 0,
+            "queued_requests": 0,
+            "queue_depth": 0,
+            "total_wait_seconds": 0.0,
+            "max_wait_seconds": 0.0,
+        })
+
+    def reserve(self, model_name: str, tokens: int) -> float:
+        with self._lock:
+            buckets = self._buckets.get(model_name)
+            if buckets is None:
+                rpm, tpm = self.limits_by_model.get(model_name, self.default_limits)
+                buckets = (TokenBucket(rpm), TokenBucket(tpm))
+                self._buckets[model_name] = buckets
+            request_bucket, token_bucket = buckets
+            wait = max(request_bucket.reserve(1), token_bucket.reserve(tokens))
+
+            stats = self._model_stats(model_name)
+            stats["requests"] += 1
+            if wait > 0:
+                stats["queued_requests"] += 1
+                stats["total_wait_seconds"] += wait
+                stats["max_wait_seconds"] = max(stats["max_wait_seconds"], wait)
+            return wait
+
+    def _queue(self, model_name: str, delta: int):
+        with self._lock:
+            self._model_stats(model_name)["queue_depth"] += delta
+
+    async def acquire_async(self, model_name: str, tokens: int):
+        wait = self.reserve(model_name, tokens)
+        if wait > 0:
+            self._queue(model_name, 1)
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self._queue(model_name, -1)
+
+    def acquire(self, model_name: str, tokens: int):
+        wait = self.reserve(model_name, tokens)
+        if wait > 0:
+            self._queue(model_name, 1)
+            try:
+                time.sleep(wait)
+            finally:
+                self._queue(model_name, -1)
+
+    def stats(self) -> Dict[str, dict]:
+        with self._lock:
+            return {model_name: dict(stats) for model_name, stats in self._stats.items()}
+
+
+rate_limiter = RateLimiter(limits_by_model=_parse_model_limits(RATE_LIMITS_BY_MODEL))
@@ -0,0 +1,114 @@
+# resilience.py
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List
+
+from google.genai.errors import ClientError, ServerError
+
+RETRY_MAX_ATTEMPTS = int(os.getenv("AGENT_RETRY_MAX_ATTEMPTS", 3))
+RETRY_BASE_DELAY_SECONDS = float(os.getenv("AGENT_RETRY_BASE_DELAY_SECONDS", 1.0))
+RETRY_MAX_DELAY_SECONDS = float(os.getenv("AGENT_RETRY_MAX_DELAY_SECONDS", 20.0))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("AGENT_BREAKER_FAILURE_THRESHOLD", 5))
+BREAKER_RESET_SECONDS = float(os.getenv("AGENT_BREAKER_RESET_SECONDS", 60.0))
+MODEL_FALLBACK_CHAIN = [
+    model.strip()
+    for model in os.getenv("AGENT_MODEL_FALLBACK_CHAIN", "gemini-2.0-flash,gemini-1.5-flash,gemini-1.5-pro").split(",")
+    if model.strip()
+]
+
+
+@dataclass
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter.
+    """
+    max_attempts: int = RETRY_MAX_ATTEMPTS
+    base_delay: float = RETRY_BASE_DELAY_SECONDS
+    max_delay: float = RETRY_MAX_DELAY_SECONDS
+
+    def delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """
+    Per-model circuit breaker.
+
+    After `failure_threshold` consecutive transient failures the circuit opens and
+    calls to the model are skipped for `reset_seconds`. Then a single trial call is
+    let through (half-open); its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_in_flight or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(model_name: str) -> CircuitBreaker:
+    with _breakers_lock:
+        breaker = _breakers.get(model_name)
+        if breaker is None:
+            breaker = CircuitBreaker()
+            _breakers[model_name] = breaker
+        return breaker
+
+
+def fallback_models(model_name: str) -> List[str]:
+    """
+    Returns the requested model followed by the rest of the fallback chain, in order.
+    """
+    return [model_name] + [model for model in MODEL_FALLBACK_CHAIN if model != model_name]
+
+
+def is_transient_error(error: Exception) -> bool:
+    """
+    Overload (503), other server errors and quota exhaustion (429) are worth retrying.
+    """
+    if isinstance(error, ServerError):
+        return True
+    if isinstance(error, ClientError):
+        return error.code == 429 or "RESOURCE_EXHAUSTED" in str(error)
+    return False
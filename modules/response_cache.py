@@ -0,0 +1,130 @@
+# response_cache.py
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+CACHE_ENABLED = os.getenv("AGENT_CACHE_ENABLED", "1") != "0"
+CACHE_PATH = os.getenv("AGENT_CACHE_PATH", os.path.join(".cache", "agent_responses.sqlite3"))
+CACHE_TTL_SECONDS = int(os.getenv("AGENT_CACHE_TTL_SECONDS", 3 * 24 * 60 * 60))
+CACHE_MAX_ENTRIES = int(os.getenv("AGENT_CACHE_MAX_ENTRIES", 5000))
+
+
+class ResponseCache:
+    """
+    On-disk key/value cache backed by SQLite.
+
+    Entries expire after `ttl_seconds` and, once the table holds more than
+    `max_entries` rows, the least recently used ones are evicted.
+    Hit and miss counters are kept per instance.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, ttl_seconds: int = CACHE_TTL_SECONDS,
+                 max_entries: int = CACHE_MAX_ENTRIES, table: str = "responses"):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.table = table
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {table}_last_access ON {table} (last_access)")
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, created_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            value, created_at = row
+            if self.ttl_seconds and now - created_at > self.ttl_seconds:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+
+            self._conn.execute(
+                f"UPDATE {self.table} SET last_access = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, created_at, last_access) "
+                "VALUES (?, ?, ?, ?)", (key, value, now, now))
+            self._evict()
+
+    def _evict(self):
+        if self.ttl_seconds:
+            self._conn.execute(
+                f"DELETE FROM {self.table} WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+
+        (count,) = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN "
+                f"(SELECT key FROM {self.table} ORDER BY last_access ASC LIMIT ?)", (overflow,))
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            (entries,) = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": entries,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def make_cache_key(agent_name: str, model_name: str, instruction: str, message_text: str) -> str:
+    """
+    Builds a content-addressed key for an agent call.
+    """
+    instruction_hash = hashlib.sha256(instruction.encode("utf-8")).hexdigest()
+    message_hash = hashlib.sha256(message_text.encode("utf-8")).hexdigest()
+    raw_key = "\x1f".join([agent_name, model_name, instruction_hash, message_hash])
+    return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+
+
+_response_cache: Optional[ResponseCache] = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """
+    Returns the process-wide agent response cache, or None when caching is disabled.
+    """
+    global _response_cache
+    if not CACHE_ENABLED:
+        return None
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache()
+        return _response_cache
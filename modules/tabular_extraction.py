@@ -0,0 +1,161 @@
+# tabular_extraction.py
+import csv
+import io
+import itertools
+import unicodedata
+from typing import Iterator, Optional
+
+import pandas as pd
+
+from modules.common import XLSX_MIME_TYPE, iter_xlsx_sheets, parse_brl_amount, spooled_upload
+
+HEADER_SEARCH_ROWS = 30
+MIN_PRICED_ROWS_RATIO = 0.5
+
+DESCRIPTION_HEADERS = ("material", "descricao", "descri", "produto", "especificacao", "description", "servico", "item")
+UNIT_PRICE_HEADERS = ("valor unit", "preco unit", "vl unit", "vlr unit", "v unit", "p unit", "unitario",
+                      "unit value", "unit price", "custo unit")
+SKIPPED_DESCRIPTIONS = ("total", "subtotal", "sub-total", "total geral")
+
+
+def _normalize_header(value) -> str:
+    text = unicodedata.normalize("NFKD", str(value)).encode("ascii", "ignore").decode("ascii")
+    return " ".join(text.lower().replace(".", " ").replace("_", " ").split())
+
+
+def _find_column(headers: list, keywords: tuple) -> Optional[int]:
+    for keyword in keywords:
+        for index, header in enumerate(headers):
+            if keyword in header:
+                return index
+    return None
+
+
+def detect_item_columns(df: pd.DataFrame) -> Optional[tuple]:
+    """
+    Looks for the header row of a quote within the first rows of the sheet.
+    Returns (header_row, description_column, unit_price_column) or None when the sheet cannot be classified.
+    """
+    for row_index in range(min(HEADER_SEARCH_ROWS, len(df))):
+        headers = [_normalize_header(value) if pd.notna(value) else "" for value in df.iloc[row_index]]
+        price_column = _find_column(headers, UNIT_PRICE_HEADERS)
+        if price_column is None:
+            continue
+        description_headers = [header if index != price_column else "" for index, header in enumerate(headers)]
+        description_column = _find_column(description_headers, DESCRIPTION_HEADERS)
+        if description_column is not None:
+            return row_index, description_column, price_column
+    return None
+
+
+def _build_items(rows: pd.DataFrame) -> Optional[list]:
+    """
+    Builds the extraction list ({"material", "unit_price"}) from the description and unit-price cells
+    of a quote sheet. Rows without a parseable unit price (section titles, notes) and total rows are
+    skipped. Returns None when too few rows carry a price, so the caller can fall back to the LLM
+    extractor.
+    """
+    rows.columns = ["material", "unit_price"]
+    rows["material"] = rows["material"].where(rows["material"].notna(), "").astype(str).str.split().str.join(" ")
+    rows = rows[rows["material"] != ""]
+    if rows.empty:
+        return None
+
+    rows["unit_price"] = rows["unit_price"].map(parse_brl_amount)
+    if rows["unit_price"].notna().mean() < MIN_PRICED_ROWS_RATIO:
+        return None
+
+    normalized_materials = rows["material"].map(_normalize_header)
+    rows = rows[rows["unit_price"].notna() & ~normalized_materials.isin(SKIPPED_DESCRIPTIONS)]
+    if rows.empty:
+        return None
+    return rows.to_dict(orient="records")
+
+
+def _extract_sheet_items(rows: Iterator[tuple]) -> Optional[list]:
+    """
+    Items of one sheet, [] for an empty sheet, or None when the sheet has content but cannot be
+    classified. Only the first rows are loaded to find the header; the rest of the sheet is
+    streamed and just the description and unit-price cells are kept.
+    """
+    head = list(itertools.islice(rows, HEADER_SEARCH_ROWS))
+    columns = detect_item_columns(pd.DataFrame(head))
+    if columns is None:
+        has_content = any(value is not None and str(value).strip()
+                          for row in itertools.chain(head, rows) for value in row)
+        return None if has_content else []
+    header_row, description_column, price_column = columns
+
+    def pick(row, column):
+        return row[column] if column < len(row) else None
+
+    selected = pd.DataFrame(
+        [(pick(row, description_column), pick(row, price_column))
+         for row in itertools.chain(head[header_row + 1:], rows)],
+        dtype="object")
+    if selected.empty:
+        return None
+    return _build_items(selected)
+
+
+def extract_items_from_file(uploaded_file) -> Optional[list]:
+    """
+    Deterministic extraction for XLSX uploads, over every sheet (each with its own header).
+    Returns None for other file types, or when any non-empty sheet cannot be classified, so the
+    whole workbook goes to the LLM extractor instead of losing that sheet's items.
+    """
+    if uploaded_file.type != XLSX_MIME_TYPE:
+        return None
+    items = []
+    try:
+        with spooled_upload(uploaded_file, ".xlsx") as path:
+            sheets = iter_xlsx_sheets(path)
+            try:
+                for _, rows in sheets:
+                    sheet_items = _extract_sheet_items(rows)
+                    if sheet_items is None:
+                        return None
+                    items.extend(sheet_items)
+            finally:
+                sheets.close()
+    except Exception as e:
+        print(f"Erro ao ler XLSX com openpyxl: {e}")
+        return None
+    return items or None
+
+
+def read_material_descriptions(uploaded_file) -> list:
+    """
+    Material descriptions listed in an uploaded CSV or XLSX, for batch quoting: the column whose
+    header looks like a description (see DESCRIPTION_HEADERS), or the first column when there is
+    no such header. Blank cells are dropped.
+    """
+    uploaded_file.seek(0)
+    if uploaded_file.type == XLSX_MIME_TYPE:
+        df = pd.read_excel(uploaded_file, header=None, dtype=str)
+    else:
+        sample = uploaded_file.read(64 * 1024).decode("utf-8", errors="ignore")
+        uploaded_file.seek(0)
+        # One description per line, unless the file has a header naming the description column:
+        # decimal commas ("Fio 2,5mm") also look like a delimiter to the sniffer.
+        delimiter = "\x1f"
+        try:
+            sniffed = csv.Sniffer().sniff(sample, delimiters=";,\t").delimiter
+            header = next(csv.reader(io.StringIO(sample), delimiter=sniffed), [])
+            if _find_column([_normalize_header(value) for value in header], DESCRIPTION_HEADERS) is not None:
+                delimiter = sniffed
+        except csv.Error:
+            pass
+        df = pd.read_csv(uploaded_file, header=None, dtype=str, sep=delimiter, skip_blank_lines=True)
+    uploaded_file.seek(0)
+    if df.empty:
+        return []
+
+    headers = [_normalize_header(value) if pd.notna(value) else "" for value in df.iloc[0]]
+    description_column = _find_column(headers, DESCRIPTION_HEADERS)
+    if description_column is None:
+        descriptions = df.iloc[:, 0]
+    else:
+        descriptions = df.iloc[1:, description_column]
+    descriptions = descriptions.dropna().str.split().str.join(" ")
+    return descriptions[descriptions != ""].tolist()
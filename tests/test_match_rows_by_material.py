@@ -0,0 +1,21 @@
+from modules.common import match_rows_by_material
+
+
+def test_dropped_item_is_not_given_another_items_row():
+    items = [{"material": "Areia media"}, {"material": "Cimento CP II 50kg"}]
+    cement = {"material": "Cimento Portland CP-II 50 kg", "lowest_price": 30}
+    assert match_rows_by_material(items, [cement]) == [None, None]
+
+
+def test_rows_match_by_canonical_key_regardless_of_order():
+    items = [{"material": "Areia media"}, {"material": "Cimento CP II 50kg"}]
+    cement = {"material": "cimento 50 kg cp ii"}
+    sand = {"material": "Areia média"}
+    assert match_rows_by_material(items, [cement, sand]) == [sand, cement]
+
+
+def test_reworded_rows_fill_unmatched_items_when_every_item_has_a_row():
+    items = [{"material": "Areia media"}, {"material": "Cimento CP II 50kg"}]
+    sand = {"material": "Areia media"}
+    cement = {"material": "Cimento Portland CP-II 50 kg"}
+    assert match_rows_by_material(items, [cement, sand]) == [sand, cement]
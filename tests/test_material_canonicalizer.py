@@ -0,0 +1,25 @@
+from modules.material_canonicalizer import canonical_material_key, parse_measure
+
+
+def test_supplier_spellings_of_the_same_wire_share_a_key():
+    key = canonical_material_key("Fio elétrico 2,5mm")
+    assert key == "2.5mm2 fio"
+    assert canonical_material_key("Cabo flexível 2.5 mm²") == key
+    assert canonical_material_key("ELECTRIC WIRE 2.5MM") == key
+
+
+def test_wire_length_is_not_read_as_a_cross_section():
+    assert canonical_material_key("Fio 2,5mm rolo 100m") == "100000mm 2.5mm2 fio rolo"
+    assert canonical_material_key("Fio 2,5mm rolo 100m") != canonical_material_key("Fio 2,5mm")
+
+
+def test_word_order_and_accents_do_not_change_the_key():
+    assert canonical_material_key("Cimento CP II 50kg") == canonical_material_key("cimento 50 kg cp ii")
+    assert canonical_material_key("Tubo PVC 100mm") == canonical_material_key("tubo pvc 10 cm")
+
+
+def test_parse_measure_converts_to_base_units():
+    assert parse_measure("100cm") == ("1000", "mm")
+    assert parse_measure("500g") == ("0.5", "kg")
+    assert parse_measure("14x19x39cm") == ("140x190x390", "mm")
+    assert parse_measure("cimento") == ("", "")
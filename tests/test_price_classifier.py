@@ -0,0 +1,26 @@
+from modules.price_classifier import classify_prices
+
+
+def _row(quoted_price, lowest_price=10.0, highest_price=20.0):
+    return {"material": "Areia", "quoted_price": quoted_price, "lowest_price": lowest_price,
+            "highest_price": highest_price, "lowest_price_links": []}
+
+
+def test_quotes_are_classified_against_the_range():
+    analysis, research_positions = classify_prices([_row(15.0), _row(30.0), _row(5.0)])
+    assert [row["status"] for row in analysis] == ["Within market", "Above market", "Below market"]
+    assert analysis[0]["percentage_variation"] == 0.0
+    assert research_positions == []
+
+
+def test_rows_without_a_quoted_price_need_research():
+    analysis, research_positions = classify_prices([_row(0), _row(None), _row("n/a"), _row(15.0)])
+    assert [row["status"] for row in analysis[:3]] == ["Research needed"] * 3
+    assert all(row["percentage_variation"] is None for row in analysis[:3])
+    assert research_positions == [0, 1, 2]
+
+
+def test_rows_without_a_full_range_need_research():
+    analysis, research_positions = classify_prices([_row(15.0, highest_price=None), _row(15.0, lowest_price=None)])
+    assert [row["status"] for row in analysis] == ["Research needed"] * 2
+    assert research_positions == [0, 1]